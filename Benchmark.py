@@ -0,0 +1,387 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+import argparse
+import numpy as np
+import pandas as pd
+import matplotlib.patches as patches
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from PriceFetch import parse_sise_json
+from StandIn import SiseStandInServer, sise_payload, synthetic_ohlcv, synthetic_sise_payload, synthetic_prices
+from PriceFrame import compact_price, memory_bytes
+from PriceCube import PriceCube
+from Screener import screen_prices
+from Signal import bollinger_indicators
+from ChartTool import price_bar, volume_bar
+from IndicatorState import IndicatorState
+from DBPool import ConnectionPool
+from PriceCache import PriceCache
+from PriceDB import PriceUpdate, PriceCheck
+from ChartExport import export_prices
+import TradingStrategy as strategy
+
+# Read-side modules and the dependencies they must not load at import
+LEAN_MODULES = ('PriceDB', 'Signal', 'Indicator', 'Screener', 'TradingStrategy')
+HEAVY_MODULES = ('matplotlib', 'seaborn', 'scipy', 'requests', 'tqdm', 'selenium', 'bs4')
+
+
+# Best wall time of {repeat} runs of func()
+def best_time(func, repeat=5):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+# Per-row parser used by PriceUpdate before parse_sise_json, kept as the benchmark baseline
+def legacy_parse_sise_json(text, code):
+    split_html = text.split('\n\t\t\n')
+    columns = ['code', 'date', 'open', 'high', 'low', 'close', 'differ', 'volume']
+    last_close = 0
+    days_value_list = []
+
+    for daily_value in split_html[1:-1]:
+        daily_value = daily_value.replace('"', '').replace(',', '').strip('[]')
+        daily_value = daily_value.split(' ')[:-1]
+
+        temp_columns = ['date', 'open', 'high', 'low', 'close', 'volume']
+        temp_df = pd.DataFrame([daily_value], columns=temp_columns)
+        temp_df[['open', 'high', 'low', 'close', 'volume']] = \
+            temp_df[['open', 'high', 'low', 'close', 'volume']].astype('int')
+
+        if last_close != 0:
+            differ = (temp_df.close.values[0] / last_close - 1) * 100
+        else:
+            differ = 0
+
+        differ_df = pd.DataFrame([differ], columns=['differ'])
+        code_df = pd.DataFrame([code], columns=['code'])
+        daily_value_df = pd.concat([temp_df, code_df, differ_df], axis=1)
+        daily_value_df = daily_value_df[columns]
+        days_value_list.append(daily_value_df)
+
+        last_close = int(daily_value_df.close.values[0])
+
+    return pd.concat(days_value_list).dropna()
+
+
+# Parse recorded payloads (a directory of {code}.json) or synthetic ones with both parsers
+def bench_parse(payload_dir=None, n_codes=20, n_days=250, repeat=3):
+    if payload_dir is not None:
+        payloads = SiseStandInServer.load(payload_dir)
+    else:
+        payloads = {f'{i:06d}': synthetic_sise_payload(n_days, seed=i) for i in range(n_codes)}
+    # A halted day with zero prices: the next day's differ must stay finite
+    halted = synthetic_ohlcv(n_days, seed=n_codes)
+    halted.loc[len(halted) // 2, ['open', 'high', 'low', 'close', 'volume']] = 0
+    payloads['halted'] = sise_payload(halted.itertuples(index=False))
+    # Empty pages (listed today) make the legacy parser raise
+    payloads = {code: text for code, text in payloads.items() if len(parse_sise_json(text, code))}
+    rows = sum(len(parse_sise_json(text, code)) for code, text in payloads.items())
+
+    def run(parser):
+        return lambda: [parser(text, code) for code, text in payloads.items()]
+
+    legacy = best_time(run(legacy_parse_sise_json), repeat)
+    vectorized = best_time(run(parse_sise_json), repeat)
+    return {'codes': len(payloads), 'rows': rows,
+            'legacy_sec': legacy, 'vectorized_sec': vectorized,
+            'legacy_rows_per_sec': rows / legacy, 'vectorized_rows_per_sec': rows / vectorized,
+            'speedup': legacy / vectorized}
+
+
+# Screen {n_codes} synthetic stocks, reporting stocks per second
+def bench_screen(n_codes=500, n_days=250, workers=None, chunk_size=100):
+    prices = synthetic_prices(n_codes, n_days)
+    start = time.perf_counter()
+    table = screen_prices(prices, workers=workers, chunk_size=chunk_size)
+    seconds = time.perf_counter() - start
+    return {'codes': n_codes, 'days': n_days, 'workers': workers or os.cpu_count(), 'chunk_size': chunk_size,
+            'signals': len(table), 'seconds': seconds, 'stocks_per_sec': n_codes / seconds}
+
+
+# Advance the indicator state of {n_codes} synthetic stocks by one day, against rebuilding it
+# from {n_days} days of history and recomputing the indicators with the screener's kernels
+def bench_indicator_state(n_codes=500, n_days=250, repeat=3):
+    prices = synthetic_prices(n_codes, n_days)
+    last = prices.date.max()
+    history, new = prices[prices.date < last], prices[prices.date == last]
+
+    start = time.perf_counter()
+    state = IndicatorState()
+    state.update(history)
+    rebuild = time.perf_counter() - start
+    saved = state.to_rows()
+
+    steps = []
+    for _ in range(repeat):
+        state = IndicatorState.from_rows(saved)
+        steps.append(best_time(lambda: state.update(new), 1))
+    step = min(steps)
+    recompute = best_time(lambda: screen_prices(prices, workers=1, chunk_size=n_codes), repeat)
+    return {'codes': n_codes, 'days': n_days, 'rebuild_sec': rebuild, 'step_sec': step,
+            'step_us_per_stock': step / n_codes * 1e6, 'recompute_sec': recompute,
+            'speedup': recompute / step}
+
+
+# Frame of one stock as PriceCheck.get_price returns it from MySQL: DATE values as datetime.date objects
+# in both the index and a date column, int64 prices, and code / name / dates repeated on every row
+def legacy_price(prices, code, name, start_date, end_date):
+    price = prices.drop(columns='code').assign(date=prices.date.dt.date)
+    price.index = price.date
+    price['code'] = code
+    price['name'] = name
+    price['start_date'] = start_date
+    price['end_date'] = end_date
+    return price
+
+
+# Memory of {n_codes} stocks x {n_days} days held as get_price frames and as compact frames,
+# and the time of the Bollinger Band indicators on each
+def bench_price_memory(n_codes=100, n_days=1250):
+    prices = synthetic_prices(n_codes, n_days)
+    start_date, end_date = f'{prices.date.min():%Y-%m-%d}', f'{prices.date.max():%Y-%m-%d}'
+    legacy = [legacy_price(frame, code, f'stock{code}', start_date, end_date)
+              for code, frame in prices.groupby('code')]
+    compact = [compact_price(frame) for frame in legacy]
+    legacy_bytes = sum(memory_bytes(frame) for frame in legacy)
+    compact_bytes = sum(memory_bytes(frame) for frame in compact)
+    legacy_sec = best_time(lambda: [bollinger_indicators(frame) for frame in legacy], 3)
+    compact_sec = best_time(lambda: [bollinger_indicators(frame) for frame in compact], 3)
+    return {'codes': n_codes, 'days': n_days, 'legacy_mb': legacy_bytes / 2 ** 20,
+            'compact_mb': compact_bytes / 2 ** 20, 'ratio': legacy_bytes / compact_bytes,
+            'legacy_bytes_per_row': legacy_bytes / len(prices), 'compact_bytes_per_row': compact_bytes / len(prices),
+            'legacy_indicators_sec': legacy_sec, 'compact_indicators_sec': compact_sec}
+
+
+# One Rectangle patch per body, wick and volume bar, as ChartTool drew before collections
+def legacy_candles(price_ax, volume_ax, price_df, up='r', down='b'):
+    last_volume = 0
+    for index, daily in enumerate(price_df.itertuples()):
+        color = up if daily.close >= daily.open else down
+        height = abs(daily.close - daily.open) if daily.close != daily.open else daily.close / 1000
+        price_ax.add_patch(patches.Rectangle((index - 0.4, min(daily.open, daily.close)), 0.8, height,
+                                             facecolor=color, fill=True))
+        price_ax.add_patch(patches.Rectangle((index - 0.06, daily.low), 0.12, daily.high - daily.low,
+                                             facecolor=color, fill=True))
+        volume_ax.add_patch(patches.Rectangle((index - 0.4, 0), 0.8, daily.volume,
+                                              facecolor=up if daily.volume >= last_volume else down, fill=True))
+        last_volume = daily.volume
+    gap = price_df.high.max() - price_df.low.min()
+    price_ax.set_ylim(price_df.low.min() - gap * 0.1, price_df.high.max() + gap * 0.1)
+    volume_ax.set_ylim(0, price_df.volume.max() * 1.2)
+
+
+def collection_candles(price_ax, volume_ax, price_df):
+    price_bar(price_ax, price_df, show_labels=False)
+    volume_bar(volume_ax, price_df, show_labels=False)
+
+
+# Draw price and volume bars of {price_df} on an offscreen canvas, returning the RGBA pixels
+def render_candles(draw, price_df):
+    figure = Figure(figsize=(12, 6), dpi=100)
+    canvas = FigureCanvasAgg(figure)
+    price_ax, volume_ax = figure.subplots(2, 1)
+    draw(price_ax, volume_ax, price_df)
+    for ax in (price_ax, volume_ax):
+        ax.set_xlim(-0.5, len(price_df) - 0.5)
+        ax.set_xticks([])
+    canvas.draw()
+    return np.asarray(canvas.buffer_rgba())
+
+
+# Render time of patch-per-day and collection candlesticks against the number of bars
+def bench_chart(bars=(250, 1250, 2500, 5000), repeat=3):
+    results = {}
+    for n_bars in bars:
+        price_df = synthetic_prices(1, n_bars)
+        legacy = best_time(lambda: render_candles(legacy_candles, price_df), repeat)
+        collection = best_time(lambda: render_candles(collection_candles, price_df), repeat)
+        same = np.array_equal(render_candles(legacy_candles, price_df), render_candles(collection_candles, price_df))
+        results[f'{n_bars} bars'] = f'legacy {legacy:.3f}s, collections {collection:.3f}s, ' \
+                                    f'speedup {legacy / collection:.1f}x, same pixels: {same}'
+    return results
+
+
+# PriceUpdate listing {listing} (code, company) instead of reading it from KRX
+def stand_in_update(db, listing, **kwargs):
+    class StandInPriceUpdate(PriceUpdate):
+        def read_stock_code(self):
+            return listing
+
+    return StandInPriceUpdate(db, **kwargs)
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+# Whole pipeline on {n_codes} synthetic stocks with {n_days} days of history, on a SQLite stand-in DB
+# fed by the siseJson stand-in server: ingestion, reads, every strategy and chart rendering
+def bench_pipeline(n_codes=50, n_days=500, workers=None, directory=None):
+    directory = directory or tempfile.mkdtemp(prefix='finance_bench_')
+    os.makedirs(directory, exist_ok=True)
+    db_path = os.path.join(directory, 'trading_db.sqlite')
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    shutil.rmtree(os.path.join(directory, 'cube'), ignore_errors=True)
+    codes = [f'{i:06d}' for i in range(n_codes)]
+    listing = pd.DataFrame({'code': codes, 'company': [f'stock{code}' for code in codes]})
+    payloads = {code: synthetic_sise_payload(n_days, seed=i) for i, code in enumerate(codes)}
+    result = {'codes': n_codes, 'days': n_days}
+
+    # Ingestion: parse, then fetch + parse + write + indicator state through PriceUpdate
+    result['parse_sec'], frames = timed(lambda: [parse_sise_json(text, code) for code, text in payloads.items()])
+    rows = sum(len(frame) for frame in frames)
+    result['parse_rows_per_sec'] = rows / result['parse_sec']
+    pool = ConnectionPool.sqlite(db_path)
+    with SiseStandInServer(payloads) as server, \
+            stand_in_update(pool, listing, base_url=server.url, workers=workers or 8, rate=None) as update:
+        result['ingest_sec'], _ = timed(lambda: update.read_days(n_days))
+        write = update.writer.report()['daily_price']
+    result['ingest_rows_per_sec'] = rows / result['ingest_sec']
+    result['write_sec'] = write['seconds']
+    result['write_rows_per_sec'] = write['rows_per_sec']
+
+    # Reads
+    start_date = f"{pd.bdate_range(end=datetime.today(), periods=n_days)[0]:%Y-%m-%d}"
+    pc = PriceCheck(pool)
+    result['get_price_sec'], _ = timed(lambda: [pc.get_price(code, start_date=start_date) for code in codes])
+    cached = PriceCheck(pool, cache=PriceCache())
+    [cached.get_price(code, start_date=start_date) for code in codes]
+    result['get_price_cached_sec'], _ = timed(lambda: [cached.get_price(code, start_date=start_date)
+                                                       for code in codes])
+    result['get_prices_sec'], prices = timed(lambda: pc.get_prices(start_date=start_date, field=None))
+    result['get_close_sec'], _ = timed(lambda: pc.get_prices(start_date=start_date, field='close'))
+    cube_path = os.path.join(directory, 'cube')
+    with pool.connection() as connection:
+        result['cube_build_sec'], _ = timed(lambda: PriceCube.build(connection, cube_path))
+    cube_pc = PriceCheck(pool, cube_path=cube_path)
+    result['get_close_cube_sec'], _ = timed(lambda: cube_pc.get_prices(start_date=start_date, field='close'))
+
+    # Strategies
+    def bollinger():
+        for code in codes:
+            bb = strategy.BollingerBand(pool, code, start_date=start_date)
+            bb.trend_signals()
+            bb.reversal_signals()
+
+    result['bollinger_band_sec'], _ = timed(bollinger)
+    result['triple_screen_sec'], _ = timed(lambda: [strategy.TripleScreenSignals(pool, code, start_date=start_date)
+                                                     for code in codes])
+    names = listing.company[:min(5, n_codes)].tolist()
+    result['modern_portfolio_sec'], portfolio = timed(
+        lambda: strategy.ModernPortfolio(pool, names=names, start_date=start_date))
+    result['efficient_frontier_sec'], _ = timed(lambda: (portfolio.efficient_frontier(), portfolio.max_sharpe()))
+    momentum = strategy.DualMomentum(pool)
+    end_date = f'{datetime.today():%Y-%m-%d}'
+    middle = f"{pd.bdate_range(end=datetime.today(), periods=n_days // 2)[0]:%Y-%m-%d}"
+    result['dual_momentum_sec'], _ = timed(lambda: momentum.abs_momentum(
+        momentum.rel_momentum(start_date, middle, min(20, n_codes)), middle, end_date))
+    result['dual_momentum_backtest_sec'], _ = timed(lambda: momentum.backtest(
+        middle, end_date, lookback=3, number=min(20, n_codes)))
+    result['screen_sec'], _ = timed(lambda: screen_prices(prices, workers=workers))
+
+    # Charts
+    charts = os.path.join(directory, 'charts')
+    report = export_prices(prices[prices.code.isin(codes[:10])], charts, workers=workers)
+    result['charts'] = report['charts']
+    result['charts_per_sec'] = report['charts_per_sec']
+
+    result['pool'] = pool.stats()
+    pool.close()
+    return result
+
+
+# Seconds to import {statement} in a fresh interpreter (best of {repeat}), and heavy modules it loaded
+def import_time(statement, repeat=3):
+    code = f"import sys, time, json; start = time.perf_counter(); {statement}; " \
+           f"print(json.dumps([time.perf_counter() - start, sorted(set(m.split('.')[0] for m in sys.modules))]))"
+    seconds, loaded = [], []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        elapsed, loaded = json.loads(output.splitlines()[-1])
+        seconds.append(elapsed)
+    return min(seconds), [module for module in HEAVY_MODULES if module in loaded]
+
+
+# Import-time regression check: each read-side module may take at most {budget} seconds more
+# than importing pandas and the DB driver, and must not load any of HEAVY_MODULES
+def check_imports(modules=LEAN_MODULES, budget=0.25, repeat=3):
+    baseline, _ = import_time('import pandas, pymysql', repeat)
+    result = {'baseline_sec': baseline}
+    failures = []
+    for module in modules:
+        seconds, heavy = import_time(f'import {module}', repeat)
+        result[module] = f"{seconds:.3f}s ({seconds - baseline:+.3f}s)" + (f", loads {', '.join(heavy)}" if heavy else '')
+        if heavy or seconds - baseline > budget:
+            failures.append(module)
+    result['failures'] = failures
+    return result
+
+
+def print_result(title, result):
+    print(title)
+    for key, value in result.items():
+        print(f'  {key}: {value:,.4f}' if isinstance(value, float) else f'  {key}: {value}')
+
+
+# Commit of the benchmarked tree, None outside a git checkout
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Finance-Project benchmarks')
+    parser.add_argument('--payload-dir', default=None, help='directory of recorded siseJson pages')
+    parser.add_argument('--codes', type=int, default=20)
+    parser.add_argument('--days', type=int, default=250)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=100)
+    parser.add_argument('--check-imports', action='store_true', help='only run the import-time check')
+    parser.add_argument('--import-budget', type=float, default=0.25,
+                        help='seconds allowed over importing pandas and pymysql')
+    parser.add_argument('--directory', default=None, help='scratch directory of the pipeline benchmark')
+    parser.add_argument('--output', default='benchmark_results.json', help='JSON results file')
+    args = parser.parse_args()
+
+    results = {'timestamp': datetime.now().isoformat(timespec='seconds'), 'commit': git_commit(),
+               'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+               'config': vars(args), 'results': {}}
+
+    def run(title, func, *func_args):
+        result = func(*func_args)
+        print_result(title, result)
+        results['results'][title] = result
+        return result
+
+    imports = run('import time', check_imports, LEAN_MODULES, args.import_budget)
+    if args.check_imports:
+        sys.exit(1 if imports['failures'] else 0)
+
+    run('siseJson parse', bench_parse, args.payload_dir, args.codes, args.days)
+    run('screener', bench_screen, args.codes, args.days, args.workers, args.chunk_size)
+    run('indicator state', bench_indicator_state, args.codes, args.days)
+    run('candlestick chart', bench_chart)
+    run('price memory', bench_price_memory, args.codes, args.days)
+    run('pipeline', bench_pipeline, args.codes, args.days, args.workers, args.directory)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'Results written to {args.output}')
@@ -0,0 +1,98 @@
+import os
+import time
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from PriceDB import PriceCheck
+from PriceFrame import compact_price
+from Signal import triple_screen_indicators
+from ChartTool import chart_rc, draw_candlestick
+from TradingStrategy import BollingerBand, draw_triple_screen
+
+# Chart kinds and their figure sizes
+CHARTS = {'candlestick': (12, 6), 'trend': (12, 6), 'reversal': (12, 8), 'triple_screen': (14, 7)}
+
+# No timestamps or version strings in the files, fixed SVG ids: same prices give byte-identical files
+METADATA = {'png': {'Software': None}, 'svg': {'Date': None, 'Creator': None}}
+
+
+def draw(figure, kind, price, code, name):
+    if kind == 'candlestick':
+        draw_candlestick(figure, price)
+    elif kind == 'trend':
+        BollingerBand.from_price(price, code, name).draw_trend(figure)
+    elif kind == 'reversal':
+        BollingerBand.from_price(price, code, name).draw_reversal(figure)
+    elif kind == 'triple_screen':
+        draw_triple_screen(figure, code, name, price, triple_screen_indicators(price))
+    else:
+        raise ValueError(f'Unknown chart: {kind}')
+
+
+# Render one chart to {path} on an Agg canvas, outside pyplot
+def render(kind, price, code, name, path, fmt='png', dpi=100):
+    with matplotlib.rc_context(dict(chart_rc(darkgrid=kind != 'candlestick'), **{'svg.hashsalt': code})):
+        figure = Figure(figsize=CHARTS[kind], dpi=dpi)
+        FigureCanvasAgg(figure)
+        draw(figure, kind, price, code, name)
+        figure.savefig(path, format=fmt, metadata=METADATA.get(fmt))
+    return path
+
+
+# Render {kinds} of every stock in a long price frame chunk to {directory}/{code}_{kind}.{fmt}
+def export_chunk(chunk, code_name_match, kinds, directory, fmt, start_date, end_date, dpi=100):
+    paths = []
+    for code, prices in chunk.groupby('code', sort=True):
+        name = code_name_match.get(code, code)
+        price = compact_price(prices, code, name, start_date, end_date)
+        for kind in kinds:
+            paths.append(render(kind, price, code, name, os.path.join(directory, f'{code}_{kind}.{fmt}'), fmt, dpi))
+    return paths
+
+
+# Export charts of a long price frame (code, date, open, high, low, close, volume).
+# Codes are sharded into chunks of {chunk_size} over {workers} processes (1: no pool); each worker
+# renders from the prices it is given, without DB access. Returns paths and charts per second.
+def export_prices(prices, directory, kinds=tuple(CHARTS), fmt='png', code_name_match=None,
+                  start_date=None, end_date=None, workers=None, chunk_size=20, dpi=100):
+    os.makedirs(directory, exist_ok=True)
+    code_name_match = code_name_match or {}
+    if start_date is None:
+        start_date = f'{prices.date.min():%Y-%m-%d}'
+    if end_date is None:
+        end_date = f'{prices.date.max():%Y-%m-%d}'
+    prices = prices.sort_values(['code', 'date'], ignore_index=True)
+
+    codes = prices.code.unique()
+    chunks = [prices[prices.code.isin(codes[i:i + chunk_size])] for i in range(0, len(codes), chunk_size)]
+    args = [(chunk, code_name_match, kinds, directory, fmt, start_date, end_date, dpi) for chunk in chunks]
+
+    start = time.perf_counter()
+    if workers == 1:
+        results = [export_chunk(*arg) for arg in args]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(export_chunk, *zip(*args))) if args else []
+    seconds = time.perf_counter() - start
+
+    paths = [path for result in results for path in result]
+    return {'charts': len(paths), 'stocks': len(codes), 'seconds': seconds,
+            'charts_per_sec': len(paths) / seconds if seconds > 0 else float('nan'), 'paths': paths}
+
+
+# Nightly export: prices of [start_date, end_date] (default: one year up to today) are read in one query
+def export(db_pw, directory, codes=None, kinds=tuple(CHARTS), start_date=None, end_date=None, fmt='png',
+           workers=None, chunk_size=20, dpi=100):
+    if start_date is None:
+        start_date = (datetime.today() - timedelta(days=365)).strftime('%Y-%m-%d')
+    if end_date is None:
+        end_date = datetime.today().strftime('%Y-%m-%d')
+    pc = PriceCheck(db_pw)
+    prices = pc.get_prices(codes, start_date=start_date, end_date=end_date, field=None)
+    report = export_prices(prices, directory, kinds, fmt, pc.code_name_match, start_date, end_date,
+                           workers, chunk_size, dpi)
+    print(f"{report['charts']} charts of {report['stocks']} stocks in {report['seconds']:.1f}s "
+          f"({report['charts_per_sec']:.1f} charts/s)")
+    return report
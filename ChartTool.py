@@ -1,103 +1,117 @@
+import numpy as np
+import pandas as pd
 import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-from matplotlib import gridspec, rc, rcParams
+from matplotlib.collections import PolyCollection
+from matplotlib import style, rc, rcParams
 from datetime import datetime, timedelta
+from PriceFrame import price_dates, price_info
+
+
+# 'seaborn-darkgrid' is named 'seaborn-v0_8-darkgrid' since matplotlib 3.6
+DARKGRID = 'seaborn-darkgrid' if 'seaborn-darkgrid' in style.available else 'seaborn-v0_8-darkgrid'
+
+
+# rcParams of the charts (Korean font, optionally the darkgrid style), for matplotlib.rc_context
+def chart_rc(darkgrid=False):
+    params = dict(style.library[DARKGRID]) if darkgrid else {}
+    params.update({'font.family': 'NanumGothic', 'axes.unicode_minus': False})
+    return params
 
 
 # If datetime format is used in x axis, x axis contains weekends.
 # Therefore, new x axis setting tool is needed.
+# Only the dates on ticks are formatted.
 class x_axis_setting:
 
-    def __init__(self, dates, setting=True, show_labels=True):
-        
-        xticks = []
-        xlabels = []
-        
+    def __init__(self, dates, setting=True, show_labels=True, ax=None):
+        dates = pd.DatetimeIndex(pd.to_datetime(np.asarray(dates)))
+        indices = np.arange(len(dates))
+
         n = len(dates) // 10
-        
+
         if n == 0:
-            for index, date in enumerate(dates):
-                xticks.append(index)
-                xlabels.append(date.strftime('%Y-%m-%d'))
+            xticks = indices
+            date_format = '%Y-%m-%d'
         else:
-            for index, date in enumerate(dates):
-                if index % n == (len(dates)-1) % n:
-                    xticks.append(index)
-                    if n <= 10:
-                        xlabels.append(date.strftime('%Y-%m-%d'))
-                    elif n <= 200:
-                        xlabels.append(date.strftime('%Y-%m'))
-                    else:
-                        xlabels.append(date.strftime('%Y'))
-        
+            xticks = indices[indices % n == (len(dates) - 1) % n]
+            if n <= 10:
+                date_format = '%Y-%m-%d'
+            elif n <= 200:
+                date_format = '%Y-%m'
+            else:
+                date_format = '%Y'
+        xticks = xticks.tolist()
+        xlabels = list(dates[xticks].strftime(date_format))
+
         if setting:
-            plt.gca().set_xticks(xticks)
+            ax = plt.gca() if ax is None else ax
+            ax.set_xticks(xticks)
 
             if show_labels:
-                plt.gca().set_xticklabels(xlabels, rotation=45, minor=False)
+                ax.set_xticklabels(xlabels, rotation=45, minor=False)
             else:
-                plt.gca().set_xticklabels([], rotation=45, minor=False)
+                ax.set_xticklabels([], rotation=45, minor=False)
 
         self.xticks = xticks
         self.xlabels = xlabels
 
 
+# Rectangles (left, bottom, width, height) as PolyCollection vertices
+def rectangles(left, bottom, width, height):
+    right, top = left + width, bottom + height
+    return np.stack([np.stack([left, bottom], axis=1), np.stack([left, top], axis=1),
+                     np.stack([right, top], axis=1), np.stack([right, bottom], axis=1)], axis=1)
+
+
+def add_rectangles(ax, left, bottom, width, height, rising, up, down):
+    colors = [up if r else down for r in rising.tolist()]
+    ax.add_collection(PolyCollection(rectangles(left, bottom, width, height), facecolors=colors,
+                                     edgecolors='none', linewidths=0))
+
+
+# Bars of {height} at x = 0 .. n-1 as one PolyCollection, drawn like ax.bar
+def bar_collection(ax, height, color, width=0.8, label=None):
+    height = np.asarray(height, dtype=np.float64)
+    index = np.arange(len(height), dtype=np.float64)
+    bars = PolyCollection(rectangles(index - 0.5 * width, np.zeros(len(index)), np.full(len(index), width),
+                                     np.nan_to_num(height)),
+                          facecolors=color, edgecolors='none', linewidths=0, label=label)
+    ax.add_collection(bars)
+    ax.autoscale_view()
+    return bars
+
+
 # Just add price bars(candlestick) at existing chart.
+# Bodies and wicks of every day are two PolyCollections.
 def price_bar(ax, price_df, up=None, down=None, show_labels=False):
     if up == None:
         up = 'r'
     if down == None:
         down = 'b'
 
-    x_axis_setting(price_df.date, True, show_labels)
+    x_axis_setting(price_dates(price_df), True, show_labels, ax)
 
-    for index, daily in enumerate(price_df.itertuples()):
-        width = 0.8
-        line_width = 0.12
-        if daily.close - daily.open != 0:
-            height = abs(daily.close - daily.open)
-        # Open and close price should appear on chart even if they are the same
-        else:
-            height = daily.close / 1000
-        line_height = (daily.high - daily.low)
-
-        if daily.close >= daily.open:
-            ax.add_patch(patches.Rectangle(
-                (index - 0.5 *  width, daily.open),
-                width, 
-                height,
-                facecolor=up,
-                fill=True
-            ))
-            ax.add_patch(patches.Rectangle(
-                (index - 0.5 * line_width, daily.low),
-                line_width,
-                line_height,
-                facecolor=up,
-                fill=True
-            ))
-        else:
-            ax.add_patch(patches.Rectangle(
-                (index - 0.5 * width, daily.close),
-                width,
-                height,
-                facecolor=down,
-                fill=True
-            ))
-            ax.add_patch(patches.Rectangle(
-                (index - 0.5 * line_width, daily.low),
-                line_width,
-                line_height,
-                facecolor=down,
-                fill=True
-            ))
+    index = np.arange(len(price_df), dtype=np.float64)
+    open_, high, low, close = [price_df[column].to_numpy(dtype=np.float64)
+                               for column in ('open', 'high', 'low', 'close')]
+    width = 0.8
+    line_width = 0.12
+    # Open and close price should appear on chart even if they are the same
+    height = np.where(close != open_, np.abs(close - open_), close / 1000)
+    rising = close >= open_
+
+    add_rectangles(ax, index - 0.5 * width, np.minimum(open_, close), np.full(len(index), width), height,
+                   rising, up, down)
+    add_rectangles(ax, index - 0.5 * line_width, low, np.full(len(index), line_width), high - low,
+                   rising, up, down)
+    ax.autoscale_view()
 
     min_price = min(price_df.low)
     max_price = max(price_df.high)
     gap = max_price - min_price
-    plt.axis([None, None, min_price - gap * 0.1, max_price + gap * 0.1])
+    ax.set_ylim(min_price - gap * 0.1, max_price + gap * 0.1)
+
 
-    
 # Just add volume bars(candlestick) at existing chart.
 # volume increase -> red / decrease -> blue
 def volume_bar(ax, price_df, up=None, down=None, show_labels=True):
@@ -105,62 +119,50 @@ def volume_bar(ax, price_df, up=None, down=None, show_labels=True):
         up = 'r'
     if down == None:
         down = 'b'
-    
-    x_axis_setting(price_df.date, True, show_labels)
-
-    last_volume = 0
-    for index, daily in enumerate(price_df.itertuples()):
-        width = 0.8
-        height = daily.volume
-
-        if daily.volume >= last_volume:
-            ax.add_patch(patches.Rectangle(
-                (index - 0.5 * width, 0),
-                width,
-                height,
-                facecolor=up,
-                fill=True
-            ))
-        else:
-            ax.add_patch(patches.Rectangle(
-                (index - 0.5 * width, 0),
-                width,
-                height,
-                facecolor=down,
-                fill=True
-            ))
-        last_volume = daily.volume
+
+    x_axis_setting(price_dates(price_df), True, show_labels, ax)
+
+    index = np.arange(len(price_df), dtype=np.float64)
+    volume = price_df.volume.to_numpy(dtype=np.float64)
+    last_volume = np.concatenate([[0], volume[:-1]])
+    width = 0.8
+
+    add_rectangles(ax, index - 0.5 * width, np.zeros(len(index)), np.full(len(index), width), volume,
+                   volume >= last_volume, up, down)
+    ax.autoscale_view()
 
     max_volume = max(price_df.volume)
-    plt.axis([None, None, 0, max_volume * 1.2])
+    ax.set_ylim(0, max_volume * 1.2)
 
 
-# Full candlestick chart
-def candlestick_chart(price_df, up=None, down=None):
-    code = price_df.code[0]
-    name = price_df.name[0]
-    start_date = price_df.start_date[0]
-    end_date = price_df.end_date[0]
-    
-    rc('font', family='NanumGothic')
-    rcParams['axes.unicode_minus'] = False
+# Draw the full candlestick chart on {figure}.
+# price_df: compact price frame, or a PriceCheck.get_price frame with code / name / dates columns
+def draw_candlestick(figure, price_df, up=None, down=None):
+    code, name, start_date, end_date = price_info(price_df)
 
-    plt.figure(figsize=(12, 6), dpi=100)
-    plt.suptitle(f"{name}({code}) Candlestick Chart ({start_date} ~ {end_date})",
-                fontsize=15, position=(0.5, 0.93))
-    gs = gridspec.GridSpec(nrows=3, ncols=1, height_ratios=[5, 2, 0.3])
+    figure.suptitle(f"{name}({code}) Candlestick Chart ({start_date} ~ {end_date})",
+                    fontsize=15, position=(0.5, 0.93))
+    gs = figure.add_gridspec(nrows=3, ncols=1, height_ratios=[5, 2, 0.3])
 
-    price_plot = plt.subplot(gs[0])
+    price_plot = figure.add_subplot(gs[0])
     price_bar(price_plot, price_df, up, down, False)
-    plt.grid(color='gray', linestyle='-')
-    plt.ylabel('ohlc candles')
-    plt.axis([-0.5, len(price_df)-0.5, None, None])
+    price_plot.grid(color='gray', linestyle='-')
+    price_plot.set_ylabel('ohlc candles')
+    price_plot.set_xlim(-0.5, len(price_df) - 0.5)
 
-    volume_plot = plt.subplot(gs[1])
+    volume_plot = figure.add_subplot(gs[1])
     volume_bar(volume_plot, price_df, up, down, True)
-    plt.grid(color='gray', linestyle='-')
-    plt.ylabel('volume')
-    plt.axis([-0.5, len(price_df)-0.5, None, None])
+    volume_plot.grid(color='gray', linestyle='-')
+    volume_plot.set_ylabel('volume')
+    volume_plot.set_xlim(-0.5, len(price_df) - 0.5)
+
+    figure.subplots_adjust(hspace=0.1)
+
+
+# Full candlestick chart
+def candlestick_chart(price_df, up=None, down=None):
+    rc('font', family='NanumGothic')
+    rcParams['axes.unicode_minus'] = False
 
-    plt.subplots_adjust(hspace=0.1)
-    plt.show()
\ No newline at end of file
+    draw_candlestick(plt.figure(figsize=(12, 6), dpi=100), price_df, up, down)
+    plt.show()
@@ -0,0 +1,174 @@
+import os
+import uuid
+import socket
+from datetime import datetime, timedelta
+from contextlib import closing
+import pandas as pd
+from DBWriter import dialect, param_mark
+
+STATUSES = ('pending', 'running', 'done', 'failed')
+
+
+# Persisted per-code jobs of a crawl run, shared by every worker process crawling it.
+# A run is identified by name (e.g. 'read_recent:2026-01-05'); enqueueing an existing run keeps the
+# state of its jobs, so a crashed or throttled run resumes with the codes not yet done.
+# Workers claim jobs atomically: one UPDATE marks a batch of pending jobs with the worker's claim token.
+# A job is tried up to {max_attempts} times, then quarantined as failed with its last error.
+# Running jobs not finished within {lease} seconds (their worker died) are claimed again.
+class CrawlQueue:
+
+    def __init__(self, connection, worker=None, lease=600, max_attempts=3):
+        self.connection = connection
+        self.worker = worker or f'{socket.gethostname()}:{os.getpid()}'
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.mark = param_mark(connection)
+
+    @staticmethod
+    def create_table(connection):
+        with closing(connection.cursor()) as cursor:
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS crawl_job (
+                run VARCHAR(64),
+                code VARCHAR(20),
+                count INT,
+                since DATE,
+                status VARCHAR(10),
+                attempts INT,
+                last_error TEXT,
+                worker VARCHAR(80),
+                claim VARCHAR(32),
+                claimed_at DATETIME,
+                created DATE,
+                PRIMARY KEY (run, code)
+            );
+            """)
+        connection.commit()
+
+    # Add {jobs} ({code: (days to fetch, last date already stored or None)}) to {run}.
+    # Codes already in the run are left as they are.
+    def enqueue(self, run, jobs):
+        ignore = 'OR IGNORE' if dialect(self.connection) == 'sqlite' else 'IGNORE'
+        today = datetime.today().strftime('%Y-%m-%d')
+        rows = [(run, code, int(count), None if since is None else f'{since:%Y-%m-%d}', 'pending', 0, today)
+                for code, (count, since) in jobs.items()]
+        with closing(self.connection.cursor()) as cursor:
+            cursor.executemany(f"INSERT {ignore} INTO crawl_job "
+                               f"(run, code, count, since, status, attempts, created) "
+                               f"VALUES ({', '.join([self.mark] * 7)})", rows)
+        self.connection.commit()
+
+    # Claim up to {n} jobs of {run}: [(code, count, since)], empty when nothing is left to claim
+    def claim(self, run, n):
+        mark = self.mark
+        now = datetime.now()
+        stale = f'{now - timedelta(seconds=self.lease):%Y-%m-%d %H:%M:%S}'
+        claimable = f"run = {mark} AND attempts < {mark} " \
+                    f"AND (status = 'pending' OR (status = 'running' AND claimed_at < {mark}))"
+        with closing(self.connection.cursor()) as cursor:
+            # Jobs whose last worker died on their final attempt
+            cursor.execute(f"UPDATE crawl_job SET status = 'failed', last_error = 'Worker lost' "
+                           f"WHERE run = {mark} AND status = 'running' AND claimed_at < {mark} AND attempts >= {mark}",
+                           (run, stale, self.max_attempts))
+            self.connection.commit()
+            while True:
+                cursor.execute(f"SELECT code FROM crawl_job WHERE {claimable} ORDER BY code LIMIT {int(n)}",
+                               (run, self.max_attempts, stale))
+                codes = [code for code, in cursor.fetchall()]
+                if not codes:
+                    return []
+                claim = uuid.uuid4().hex
+                # Jobs taken by another worker since the SELECT no longer match and are left alone
+                cursor.execute(f"UPDATE crawl_job SET status = 'running', attempts = attempts + 1, "
+                               f"worker = {mark}, claim = {mark}, claimed_at = {mark} "
+                               f"WHERE {claimable} AND code IN ({', '.join([mark] * len(codes))})",
+                               [self.worker, claim, f'{now:%Y-%m-%d %H:%M:%S}', run, self.max_attempts, stale]
+                               + codes)
+                self.connection.commit()
+                cursor.execute(f"SELECT code, count, since FROM crawl_job WHERE run = {mark} AND claim = {mark}",
+                               (run, claim))
+                jobs = cursor.fetchall()
+                if jobs:
+                    return [(code, count, None if since is None else pd.Timestamp(since))
+                            for code, count, since in sorted(jobs)]
+
+    # Record the outcome of claimed jobs, after the prices of {done} are committed.
+    # {failed}: {code: error}; they go back to pending until their attempts run out.
+    def finish(self, run, done, failed=None):
+        mark = self.mark
+        failed = failed or {}
+        with closing(self.connection.cursor()) as cursor:
+            if done:
+                done = list(done)
+                cursor.execute(f"UPDATE crawl_job SET status = 'done', last_error = NULL "
+                               f"WHERE run = {mark} AND code IN ({', '.join([mark] * len(done))})", [run] + done)
+            for code, error in failed.items():
+                cursor.execute(f"UPDATE crawl_job SET last_error = {mark}, "
+                               f"status = CASE WHEN attempts >= {mark} THEN 'failed' ELSE 'pending' END "
+                               f"WHERE run = {mark} AND code = {mark}",
+                               (f'{type(error).__name__}: {error}'[:1000], self.max_attempts, run, code))
+        self.connection.commit()
+
+    # Put the running jobs of this worker back to pending, when it stops before finishing them
+    def release(self, run):
+        mark = self.mark
+        with closing(self.connection.cursor()) as cursor:
+            cursor.execute(f"UPDATE crawl_job SET status = 'pending' "
+                           f"WHERE run = {mark} AND status = 'running' AND worker = {mark}", (run, self.worker))
+        self.connection.commit()
+
+    # Latest run named {prefix}... with jobs not done yet (pending or running), None if there is none
+    def unfinished(self, prefix):
+        mark = self.mark
+        with closing(self.connection.cursor()) as cursor:
+            cursor.execute(f"SELECT MAX(run) FROM crawl_job "
+                           f"WHERE run LIKE {mark} AND status IN ('pending', 'running')", (f'{prefix}%',))
+            return cursor.fetchone()[0]
+
+    # Number of jobs of {run} in each status
+    def counts(self, run):
+        with closing(self.connection.cursor()) as cursor:
+            cursor.execute(f"SELECT status, COUNT(*) FROM crawl_job WHERE run = {self.mark} GROUP BY status",
+                           (run,))
+            rows = cursor.fetchall()
+        counts = dict.fromkeys(STATUSES, 0)
+        counts.update(rows)
+        return counts
+
+    # (code, last date before the crawl or None) of the jobs of {run} done
+    def done(self, run):
+        with closing(self.connection.cursor()) as cursor:
+            cursor.execute(f"SELECT code, since FROM crawl_job WHERE run = {self.mark} AND status = 'done'",
+                           (run,))
+            rows = cursor.fetchall()
+        return [(code, None if since is None else pd.Timestamp(since)) for code, since in rows]
+
+    # Quarantined jobs of {run} with their attempts and last error
+    def failed(self, run):
+        with closing(self.connection.cursor()) as cursor:
+            cursor.execute(f"SELECT code, attempts, last_error FROM crawl_job "
+                           f"WHERE run = {self.mark} AND status = 'failed' ORDER BY code", (run,))
+            rows = cursor.fetchall()
+        return pd.DataFrame(rows, columns=['code', 'attempts', 'last_error'])
+
+    # Give quarantined jobs of {run} (or only {codes}) a fresh set of attempts
+    def retry_failed(self, run, codes=None):
+        mark = self.mark
+        sql = f"UPDATE crawl_job SET status = 'pending', attempts = 0 WHERE run = {mark} AND status = 'failed'"
+        params = [run]
+        if codes is not None:
+            codes = list(codes)
+            sql += f" AND code IN ({', '.join([mark] * len(codes))})"
+            params += codes
+        with closing(self.connection.cursor()) as cursor:
+            cursor.execute(sql, params)
+            count = cursor.rowcount
+        self.connection.commit()
+        return count
+
+    # Delete jobs of runs enqueued more than {keep_days} days ago
+    def purge(self, keep_days=30):
+        cutoff = (datetime.today() - timedelta(days=keep_days)).strftime('%Y-%m-%d')
+        with closing(self.connection.cursor()) as cursor:
+            cursor.execute(f"DELETE FROM crawl_job WHERE created < {self.mark}", (cutoff,))
+        self.connection.commit()
@@ -0,0 +1,152 @@
+import os
+import sqlite3
+import threading
+import time
+from functools import partial
+from contextlib import contextmanager
+import pymysql
+from DBWriter import dialect
+
+
+# Pool of DB connections shared by PriceUpdate, PriceCheck and the strategies.
+# Connections are made by connect() (default: pymysql with the given settings) up to {size} at once;
+# a checkout waits up to {timeout} seconds for one to come back, then raises TimeoutError.
+# Idle MySQL connections are pinged (and reconnected) on checkout.
+# A pool pickles to an empty pool with the same settings, for worker processes (connect must be picklable).
+class ConnectionPool:
+
+    def __init__(self, db_pw=None, host='localhost', user='root', db='trading_db', charset='utf8', size=8,
+                 timeout=30, connect=None, **connect_args):
+        if connect is None:
+            connect = partial(pymysql.connect, host=host, user=user, db=db, password=db_pw, charset=charset,
+                              **connect_args)
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.idle = []
+        self.in_use = 0
+        self.condition = threading.Condition()
+        self.created = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.max_in_use = 0
+        self.closed = False
+
+    # Pool of connections to one SQLite file, the stand-in for MySQL in benchmarks and local runs
+    @classmethod
+    def sqlite(cls, path, size=8, timeout=30):
+        return cls(size=size, timeout=timeout, connect=partial(sqlite3.connect, path, check_same_thread=False))
+
+    def __getstate__(self):
+        return {'connect': self.connect, 'size': self.size, 'timeout': self.timeout}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def checkout(self):
+        deadline = time.monotonic() + self.timeout
+        with self.condition:
+            if self.closed:
+                raise RuntimeError('Connection pool is closed')
+            if not self.idle and self.in_use >= self.size:
+                self.waits += 1
+                while not self.idle and self.in_use >= self.size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not self.condition.wait(remaining):
+                        raise TimeoutError(f'No DB connection free within {self.timeout}s')
+            connection = self.idle.pop() if self.idle else None
+            self.in_use += 1
+            self.checkouts += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+        try:
+            if connection is None:
+                connection = self.connect()
+                with self.condition:
+                    self.created += 1
+            elif dialect(connection) == 'mysql':
+                connection.ping(reconnect=True)
+        except Exception:
+            with self.condition:
+                self.in_use -= 1
+                self.condition.notify()
+            raise
+        return connection
+
+    # Return a connection, ending its transaction so the next checkout reads fresh data instead of
+    # an old snapshot. Broken ones (discard=True, or the rollback fails) are closed instead of reused.
+    def checkin(self, connection, discard=False):
+        if not discard and not self.closed:
+            try:
+                connection.rollback()
+            except Exception:
+                discard = True
+        with self.condition:
+            self.in_use -= 1
+            if discard or self.closed:
+                connection.close()
+            else:
+                self.idle.append(connection)
+            self.condition.notify()
+
+    # with pool.connection() as connection: ... — uncommitted work is rolled back on return
+    @contextmanager
+    def connection(self):
+        connection = self.checkout()
+        try:
+            yield connection
+        finally:
+            self.checkin(connection)
+
+    # Close idle connections; checked out ones are closed when they come back
+    def close(self):
+        with self.condition:
+            self.closed = True
+            idle, self.idle = self.idle, []
+        for connection in idle:
+            connection.close()
+
+    def stats(self):
+        with self.condition:
+            return {'created': self.created, 'checkouts': self.checkouts,
+                    'reuses': self.checkouts - self.created,
+                    'reuse_rate': 1 - self.created / self.checkouts if self.checkouts else 0.0,
+                    'in_use': self.in_use, 'idle': len(self.idle), 'max_in_use': self.max_in_use,
+                    'waits': self.waits}
+
+
+pools = {}
+pools_lock = threading.Lock()
+
+
+# A forked process (crawl workers, screener and chart processes) starts without the parent's pools:
+# their idle connections share sockets with the parent. They are dropped, not closed, which would end
+# the parent's sessions too.
+def forget_pools():
+    global pools, pools_lock
+    pools = {}
+    pools_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=forget_pools)
+
+
+# The pool every class uses when given a DB password instead of a ConnectionPool:
+# one per process and set of connection settings
+def shared_pool(db_pw, **connect_args):
+    key = (db_pw, tuple(sorted(connect_args.items())))
+    with pools_lock:
+        if key not in pools:
+            pools[key] = ConnectionPool(db_pw, **connect_args)
+        return pools[key]
+
+
+# {db}: ConnectionPool, or DB password of the shared pool
+def get_pool(db, **connect_args):
+    return db if isinstance(db, ConnectionPool) else shared_pool(db, **connect_args)
@@ -0,0 +1,156 @@
+import os
+import csv
+import time
+import sqlite3
+import tempfile
+from contextlib import closing
+import pandas as pd
+
+# SQLite (before 3.32) limits a statement to 999 bound parameters
+SQLITE_MAX_PARAMS = 999
+
+
+# 'sqlite' for the sqlite3 stand-in, 'mysql' for pymysql (MySQL / MariaDB)
+def dialect(connection):
+    return 'sqlite' if isinstance(connection, sqlite3.Connection) else 'mysql'
+
+
+# Placeholder of the connection's paramstyle
+def param_mark(connection):
+    return '?' if dialect(connection) == 'sqlite' else '%s'
+
+
+# DataFrame -> list of tuples of plain python values, dates as 'YYYY-MM-DD'
+def to_rows(df, columns):
+    df = df[list(columns)].copy()
+    for column in columns:
+        if pd.api.types.is_datetime64_any_dtype(df[column]):
+            df[column] = df[column].dt.strftime('%Y-%m-%d')
+    return [tuple(row) for row in df.to_numpy(dtype=object).tolist()]
+
+
+# Batched upsert writer.
+# method: 'multirow' (one multi-row INSERT per batch), 'executemany' or 'infile' (LOAD DATA LOCAL INFILE,
+# MySQL only, the connection needs local_infile=True).
+# Rows are buffered per table, written every {batch_size} rows and committed every {commit_size} rows.
+class BulkWriter:
+
+    def __init__(self, connection, batch_size=1000, commit_size=10000, method='multirow'):
+        if method == 'infile' and dialect(connection) != 'mysql':
+            raise ValueError('LOAD DATA LOCAL INFILE needs a MySQL connection')
+        self.connection = connection
+        self.dialect = dialect(connection)
+        self.batch_size = batch_size
+        self.commit_size = commit_size
+        self.method = method
+        self.buffers = {}  # table -> (columns, keys, rows)
+        self.uncommitted = 0
+        self.stats = {}  # table -> [rows, seconds]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.flush()
+
+    # rows: DataFrame, or iterable of tuples in {columns} order. keys: primary key columns.
+    def upsert(self, table, rows, columns=None, keys=None):
+        if isinstance(rows, pd.DataFrame):
+            columns = list(rows.columns) if columns is None else list(columns)
+            rows = to_rows(rows, columns)
+        if table not in self.buffers:
+            self.buffers[table] = (list(columns), list(keys), [])
+        buffer = self.buffers[table][2]
+        buffer.extend(rows)
+        if len(buffer) >= self.batch_size:
+            self.write(table)
+
+    # Write every buffered row and commit
+    def flush(self):
+        for table in self.buffers:
+            self.write(table)
+        self.commit()
+
+    # Drop buffered rows and roll back the uncommitted ones
+    def discard(self):
+        for _, _, buffer in self.buffers.values():
+            buffer.clear()
+        self.connection.rollback()
+        self.uncommitted = 0
+
+    def commit(self):
+        if self.uncommitted:
+            self.connection.commit()
+            self.uncommitted = 0
+
+    def write(self, table):
+        columns, keys, buffer = self.buffers[table]
+        if not buffer:
+            return
+        start = time.perf_counter()
+        with closing(self.connection.cursor()) as cursor:
+            for i in range(0, len(buffer), self.batch_size):
+                batch = buffer[i:i + self.batch_size]
+                if self.method == 'executemany':
+                    cursor.executemany(self.upsert_sql(table, columns, keys, 1), batch)
+                elif self.method == 'infile':
+                    self.load_infile(cursor, table, columns, batch)
+                else:
+                    step = self.rows_per_statement(columns)
+                    for j in range(0, len(batch), step):
+                        chunk = batch[j:j + step]
+                        cursor.execute(self.upsert_sql(table, columns, keys, len(chunk)),
+                                       [value for row in chunk for value in row])
+        stat = self.stats.setdefault(table, [0, 0.0])
+        stat[0] += len(buffer)
+        self.uncommitted += len(buffer)
+        buffer.clear()
+        if self.uncommitted >= self.commit_size:
+            self.commit()
+        stat[1] += time.perf_counter() - start
+
+    def rows_per_statement(self, columns):
+        if self.dialect == 'sqlite':
+            return max(1, min(self.batch_size, SQLITE_MAX_PARAMS // len(columns)))
+        return self.batch_size
+
+    def upsert_sql(self, table, columns, keys, n_rows):
+        mark = param_mark(self.connection)
+        values = ', '.join(['(' + ', '.join([mark] * len(columns)) + ')'] * n_rows)
+        updates = [column for column in columns if column not in keys]
+        sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES {values}"
+        if self.dialect == 'sqlite':
+            if updates:
+                sql += f" ON CONFLICT ({', '.join(keys)}) DO UPDATE SET " \
+                       + ', '.join(f'{column} = excluded.{column}' for column in updates)
+            else:
+                sql += ' ON CONFLICT DO NOTHING'
+        else:
+            updates = updates or keys[:1]
+            sql += ' ON DUPLICATE KEY UPDATE ' + ', '.join(f'{column} = VALUES({column})' for column in updates)
+        return sql
+
+    # noinspection PyMethodMayBeStatic
+    def load_infile(self, cursor, table, columns, batch):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', newline='', encoding='utf-8',
+                                         delete=False) as f:
+            csv.writer(f, lineterminator='\n').writerows(batch)
+            path = f.name
+        try:
+            cursor.execute(f"LOAD DATA LOCAL INFILE '{path}' REPLACE INTO TABLE {table} "
+                           f"CHARACTER SET utf8 FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' "
+                           f"LINES TERMINATED BY '\\n' ({', '.join(columns)})")
+        finally:
+            os.remove(path)
+
+    # Rows written and rows per second of each table
+    def report(self):
+        return {table: {'rows': rows, 'seconds': seconds,
+                        'rows_per_sec': rows / seconds if seconds > 0 else float('nan')}
+                for table, (rows, seconds) in self.stats.items()}
+
+    def print_report(self):
+        for table, stat in self.report().items():
+            print(f"{table}: {stat['rows']} rows in {stat['seconds']:.2f}s ({stat['rows_per_sec']:,.0f} rows/s)")
+
@@ -0,0 +1,164 @@
+import numpy as np
+import pandas as pd
+
+
+# Indicator kernels on 1-D series or 2-D (date x code) arrays, so many stocks are computed in one call.
+# Time runs along axis 0. NaN marks a missing price (e.g. before listing) and is skipped like pandas does.
+# pandas input gives pandas output with the same index (and columns).
+
+
+def to_array(x):
+    return np.asarray(x, dtype=np.float64)
+
+
+def wrap(result, like):
+    if isinstance(like, pd.DataFrame):
+        return pd.DataFrame(result, index=like.index, columns=like.columns)
+    if isinstance(like, pd.Series):
+        return pd.Series(result, index=like.index, name=like.name)
+    return result
+
+
+# Views of x shifted by 0 .. window-1 rows, padded with NaN at the top
+def shifted(x, window):
+    pad = np.full((window - 1,) + x.shape[1:], np.nan)
+    padded = np.concatenate([pad, x])
+    n = len(x)
+    for k in range(window):
+        yield padded[window - 1 - k:window - 1 - k + n]
+
+
+# Number of valid values and their sum in each trailing window
+def window_sum(x, window):
+    count = np.zeros(x.shape)
+    total = np.zeros(x.shape)
+    for view in shifted(x, window):
+        valid = ~np.isnan(view)
+        count += valid
+        total += np.where(valid, view, 0)
+    return count, total
+
+
+def rolling_sum(x, window, min_periods=1):
+    values = to_array(x)
+    count, total = window_sum(values, window)
+    return wrap(np.where(count >= min_periods, total, np.nan), x)
+
+
+def rolling_mean(x, window, min_periods=1):
+    values = to_array(x)
+    count, total = window_sum(values, window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+    return wrap(np.where(count >= min_periods, mean, np.nan), x)
+
+
+# Sample standard deviation (ddof=1) in two passes, as stable as pandas
+def rolling_std(x, window, min_periods=1, ddof=1):
+    values = to_array(x)
+    count, total = window_sum(values, window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        squares = np.zeros(values.shape)
+        for view in shifted(values, window):
+            squares += np.where(np.isnan(view), 0, (view - mean) ** 2)
+        std = np.sqrt(squares / (count - ddof))
+    return wrap(np.where((count >= min_periods) & (count > ddof), std, np.nan), x)
+
+
+def rolling_max(x, window, min_periods=1):
+    values = to_array(x)
+    count = np.zeros(values.shape)
+    result = np.full(values.shape, np.nan)
+    for view in shifted(values, window):
+        count += ~np.isnan(view)
+        result = np.fmax(result, view)
+    return wrap(np.where(count >= min_periods, result, np.nan), x)
+
+
+def rolling_min(x, window, min_periods=1):
+    values = to_array(x)
+    count = np.zeros(values.shape)
+    result = np.full(values.shape, np.nan)
+    for view in shifted(values, window):
+        count += ~np.isnan(view)
+        result = np.fmin(result, view)
+    return wrap(np.where(count >= min_periods, result, np.nan), x)
+
+
+# Exponential moving average, same as pandas ewm(span=span).mean() (adjust=True).
+# One vectorized step per date across every code.
+def ema(x, span):
+    values = to_array(x)
+    decay = 1 - 2 / (span + 1)
+    numerator = np.zeros(values.shape[1:])
+    denominator = np.zeros(values.shape[1:])
+    result = np.empty(values.shape)
+    for t in range(len(values)):
+        valid = ~np.isnan(values[t])
+        numerator = numerator * decay + np.where(valid, values[t], 0)
+        denominator = denominator * decay + valid
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result[t] = np.where(denominator > 0, numerator / denominator, np.nan)
+    return wrap(result, x)
+
+
+# Bollinger Band: (ma, stdev, upperbb, lowerbb)
+def bollinger_band(close, window=20, k=2):
+    ma = rolling_mean(close, window)
+    stdev = rolling_std(close, window)
+    return ma, stdev, ma + k * stdev, ma - k * stdev
+
+
+# %B: position of close inside the band
+def percent_b(close, upperbb, lowerbb):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (close - lowerbb) / (upperbb - lowerbb)
+
+
+# Money Flow Index: (tp, pmf, nmf, mfi).
+# Money flow counts as positive when typical price rises, negative otherwise;
+# the first valid day counts as both.
+def money_flow_index(high, low, close, volume, window=10):
+    tp = (to_array(low) + to_array(close) + to_array(high)) / 3  # typical price
+    money_flow = tp * to_array(volume)
+    previous = np.full(tp.shape, np.nan)
+    previous[1:] = tp[:-1]
+    first = np.isnan(previous)
+    with np.errstate(invalid='ignore'):
+        rising = tp > previous
+    pmf = np.where(rising | first, money_flow, 0)  # positive money flow
+    nmf = np.where(~rising | first, money_flow, 0)  # negative money flow
+    pmf[np.isnan(tp)] = np.nan
+    nmf[np.isnan(tp)] = np.nan
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mfi = 100 - 100 / (1 + rolling_sum(pmf, window) / rolling_sum(nmf, window))
+    return wrap(tp, close), wrap(pmf, close), wrap(nmf, close), wrap(mfi, close)
+
+
+# Intraday Intensity: (ii, iip), iip = II% over {window} days
+def intraday_intensity(high, low, close, volume, window=21):
+    high, low, close_, volume_ = to_array(high), to_array(low), to_array(close), to_array(volume)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ii = (2 * close_ - high - low) / (high - low) * volume_
+        iip = rolling_sum(ii, window) / rolling_sum(volume_, window) * 100
+    return wrap(ii, close), wrap(iip, close)
+
+
+# MACD: (ema_fast, ema_slow, macd, signal, macd_hist)
+def macd(close, fast=60, slow=130, signal=45):
+    ema_fast = ema(close, fast)
+    ema_slow = ema(close, slow)
+    macd_ = ema_fast - ema_slow
+    signal_ = ema(macd_, signal)
+    return ema_fast, ema_slow, macd_, signal_, macd_ - signal_
+
+
+# Stochastic oscillator: (%K, %D)
+def stochastic(high, low, close, k_window=14, d_window=3):
+    highest = rolling_max(high, k_window)
+    lowest = rolling_min(low, k_window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        pk = (to_array(close) - to_array(lowest)) / (to_array(highest) - to_array(lowest)) * 100
+    pd_ = rolling_mean(pk, d_window)
+    return wrap(pk, close), wrap(pd_, close)
@@ -0,0 +1,227 @@
+import json
+import numpy as np
+import pandas as pd
+from DBWriter import param_mark
+from Signal import BOLLINGER_COLUMNS, TRIPLE_SCREEN_COLUMNS
+
+# Streaming state of the BollingerBand / TripleScreen indicators, one row per code.
+# Window buffers hold the last values each rolling indicator needs (NaN until filled),
+# EMA accumulators hold the adjust=True numerator and denominator, so every new bar costs O(1)
+# and gives the same values as the Indicator kernels over the full history.
+
+WINDOWS = {'close': 20, 'pmf': 10, 'nmf': 10, 'ii': 21, 'volume': 21, 'high': 14, 'low': 14, 'pk': 3}
+SPANS = {'ema60': 60, 'ema130': 130, 'signal': 45}
+SCALARS = ['tp', 'last_ema130', 'last_pd'] + [f'{name}_{part}' for name in SPANS for part in ('num', 'den')]
+STATE_COLUMNS = ['close'] + BOLLINGER_COLUMNS + TRIPLE_SCREEN_COLUMNS + ['last_ema130', 'last_pd']
+
+
+# Sum of the valid values of each buffer row, NaN when there are none (rolling min_periods=1)
+def window_total(buffer):
+    valid = ~np.isnan(buffer)
+    return np.where(valid.any(axis=1), np.where(valid, buffer, 0).sum(axis=1), np.nan)
+
+
+def window_mean(buffer):
+    count = (~np.isnan(buffer)).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return window_total(buffer) / count
+
+
+def window_std(buffer, ddof=1):
+    count = (~np.isnan(buffer)).sum(axis=1)
+    mean = window_mean(buffer)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        squares = np.where(np.isnan(buffer), 0, (buffer - mean[:, None]) ** 2).sum(axis=1)
+        return np.where(count > ddof, np.sqrt(squares / (count - ddof)), np.nan)
+
+
+class IndicatorState:
+
+    def __init__(self):
+        self.codes = []
+        self.index = {}  # code -> row
+        self.dates = np.array([], dtype='datetime64[ns]')  # last bar of each code
+        self.buffers = {name: np.empty((0, window)) for name, window in WINDOWS.items()}
+        self.scalars = {name: np.empty(0) for name in SCALARS}
+        self.values = {column: np.empty(0) for column in STATE_COLUMNS}
+
+    # Rows of {codes}, appending fresh state for unknown codes
+    def rows(self, codes):
+        new = [code for code in dict.fromkeys(codes) if code not in self.index]
+        if new:
+            n = len(new)
+            for code in new:
+                self.index[code] = len(self.codes)
+                self.codes.append(code)
+            self.dates = np.concatenate([self.dates, np.full(n, np.datetime64('NaT'), dtype='datetime64[ns]')])
+            for name, window in WINDOWS.items():
+                self.buffers[name] = np.concatenate([self.buffers[name], np.full((n, window), np.nan)])
+            for name in SCALARS:
+                fill = 0.0 if name.endswith(('_num', '_den')) else np.nan
+                self.scalars[name] = np.concatenate([self.scalars[name], np.full(n, fill)])
+            for column in STATE_COLUMNS:
+                self.values[column] = np.concatenate([self.values[column], np.full(n, np.nan)])
+        return np.array([self.index[code] for code in codes], dtype=np.int64)
+
+    # Forget {codes}, so the next update starts them from their first bar
+    def reset(self, codes):
+        rows = self.rows(codes)
+        self.dates[rows] = np.datetime64('NaT')
+        for name in WINDOWS:
+            self.buffers[name][rows] = np.nan
+        for name in SCALARS:
+            self.scalars[name][rows] = 0.0 if name.endswith(('_num', '_den')) else np.nan
+        for column in STATE_COLUMNS:
+            self.values[column][rows] = np.nan
+
+    def push(self, name, rows, x):
+        buffer = self.buffers[name]
+        buffer[rows, :-1] = buffer[rows, 1:]
+        buffer[rows, -1] = x
+        return buffer[rows]
+
+    def ema(self, name, rows, x):
+        decay = 1 - 2 / (SPANS[name] + 1)
+        numerator = self.scalars[f'{name}_num'][rows] * decay + x
+        denominator = self.scalars[f'{name}_den'][rows] * decay + 1
+        self.scalars[f'{name}_num'][rows] = numerator
+        self.scalars[f'{name}_den'][rows] = denominator
+        return numerator / denominator
+
+    # Advance {rows} by one bar each
+    def step(self, rows, dates, high, low, close, volume):
+        values = {'close': close}
+
+        # Bollinger Band, %B
+        closes = self.push('close', rows, close)
+        values['ma'] = window_mean(closes)
+        values['stdev'] = window_std(closes)
+        values['upperbb'] = values['ma'] + 2 * values['stdev']
+        values['lowerbb'] = values['ma'] - 2 * values['stdev']
+        with np.errstate(invalid='ignore', divide='ignore'):
+            values['pb'] = (close - values['lowerbb']) / (values['upperbb'] - values['lowerbb'])
+
+        # MFI: the first bar of a code counts as both positive and negative money flow
+        tp = (low + close + high) / 3
+        previous = self.scalars['tp'][rows]
+        first = np.isnan(previous)
+        with np.errstate(invalid='ignore'):
+            rising = tp > previous
+        values['tp'] = tp
+        values['pmf'] = np.where(rising | first, tp * volume, 0)
+        values['nmf'] = np.where(~rising | first, tp * volume, 0)
+        self.scalars['tp'][rows] = tp
+        with np.errstate(invalid='ignore', divide='ignore'):
+            values['mfi'] = 100 - 100 / (1 + window_total(self.push('pmf', rows, values['pmf']))
+                                         / window_total(self.push('nmf', rows, values['nmf'])))
+
+            # II, II%
+            values['ii'] = (2 * close - high - low) / (high - low) * volume
+            values['iip'] = window_total(self.push('ii', rows, values['ii'])) \
+                / window_total(self.push('volume', rows, volume)) * 100
+
+        # MACD
+        self.scalars['last_ema130'][rows] = self.values['ema130'][rows]
+        values['ema60'] = self.ema('ema60', rows, close)
+        values['ema130'] = self.ema('ema130', rows, close)
+        values['macd'] = values['ema60'] - values['ema130']
+        values['signal'] = self.ema('signal', rows, values['macd'])
+        values['macd_hist'] = values['macd'] - values['signal']
+
+        # Stochastic %K, %D
+        self.scalars['last_pd'][rows] = self.values['pd'][rows]
+        highest = np.fmax.reduce(self.push('high', rows, high), axis=1)
+        lowest = np.fmin.reduce(self.push('low', rows, low), axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            values['pk'] = (close - lowest) / (highest - lowest) * 100
+        values['pd'] = window_mean(self.push('pk', rows, values['pk']))
+
+        values['last_ema130'] = self.scalars['last_ema130'][rows]
+        values['last_pd'] = self.scalars['last_pd'][rows]
+        for column in STATE_COLUMNS:
+            self.values[column][rows] = values[column]
+        self.dates[rows] = dates
+
+    # Advance by a long price frame (code, date, high, low, close, volume).
+    # Bars not after a code's last bar are ignored. One vectorized step per date over its codes.
+    def update(self, prices):
+        if prices.empty:
+            return 0
+        prices = prices.sort_values(['date', 'code'])
+        rows = self.rows(prices.code.tolist())
+        dates = pd.to_datetime(prices.date).to_numpy(dtype='datetime64[ns]')
+        last = self.dates[rows]
+        new = np.isnat(last) | (dates > last)
+        rows, dates = rows[new], dates[new]
+        high, low, close, volume = [prices[column].to_numpy(dtype=np.float64)[new]
+                                    for column in ('high', 'low', 'close', 'volume')]
+        bounds = np.flatnonzero(np.diff(dates.astype(np.int64))) + 1
+        for day in np.split(np.arange(len(rows)), bounds):
+            if len(day):
+                self.step(rows[day], dates[day], high[day], low[day], close[day], volume[day])
+        return int(new.sum())
+
+    # Latest indicator values of {codes} (default: all), indexed by code
+    def latest(self, codes=None):
+        codes = self.codes if codes is None else [code for code in codes if code in self.index]
+        rows = np.array([self.index[code] for code in codes], dtype=np.int64)
+        latest = pd.DataFrame({column: self.values[column][rows] for column in STATE_COLUMNS},
+                              index=pd.Index(codes, name='code'))
+        latest.insert(0, 'date', self.dates[rows])
+        return latest[latest.date.notna()]
+
+    # (code, date, state json) of {codes}
+    def to_rows(self, codes=None):
+        codes = self.codes if codes is None else codes
+        rows = []
+        for code in codes:
+            row = self.index[code]
+            if np.isnat(self.dates[row]):
+                continue
+            state = {'buffers': {name: self.buffers[name][row].tolist() for name in WINDOWS},
+                     'scalars': {name: float(self.scalars[name][row]) for name in SCALARS},
+                     'values': {column: float(self.values[column][row]) for column in STATE_COLUMNS}}
+            rows.append((code, f'{pd.Timestamp(self.dates[row]):%Y-%m-%d}', json.dumps(state)))
+        return rows
+
+    @classmethod
+    def from_rows(cls, rows):
+        state = cls()
+        rows = list(rows)
+        indexes = state.rows([code for code, _, _ in rows])
+        for row, (_, date, text) in zip(indexes, rows):
+            saved = json.loads(text)
+            state.dates[row] = np.datetime64(pd.Timestamp(date), 'ns')
+            for name in WINDOWS:
+                state.buffers[name][row] = saved['buffers'][name]
+            for name in SCALARS:
+                state.scalars[name][row] = saved['scalars'][name]
+            for column in STATE_COLUMNS:
+                state.values[column][row] = saved['values'][column]
+        return state
+
+    # State saved in the indicator_state table, of {codes} (default: all), read {chunk_size} codes per query
+    @classmethod
+    def load(cls, connection, codes=None, chunk_size=500):
+        sql = "SELECT code, date, state FROM indicator_state"
+        if codes is None:
+            chunks = [None]
+        else:
+            codes = list(codes)
+            chunks = [codes[i:i + chunk_size] for i in range(0, len(codes), chunk_size)]
+        rows = []
+        cursor = connection.cursor()
+        try:
+            for chunk in chunks:
+                if chunk is None:
+                    cursor.execute(sql)
+                else:
+                    cursor.execute(sql + f" WHERE code IN ({', '.join([param_mark(connection)] * len(chunk))})", chunk)
+                rows.extend(cursor.fetchall())
+        finally:
+            cursor.close()
+        return cls.from_rows(rows)
+
+    # Buffer the state of {codes} (default: all) into a BulkWriter
+    def save(self, writer, codes=None):
+        writer.upsert('indicator_state', self.to_rows(codes), columns=('code', 'date', 'state'), keys=('code',))
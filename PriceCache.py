@@ -0,0 +1,203 @@
+import os
+import json
+import tempfile
+import threading
+from collections import OrderedDict
+import pandas as pd
+
+
+# Read-through cache of daily_price windows behind PriceCheck.get_price.
+# One entry per code holds a contiguous window [start, end] as read from DB; any sub-range is served from it.
+# Entries remember the watermark (last price date written by PriceUpdate) at fill time:
+# once the watermark moves, windows reaching past the old watermark are stale.
+# Memory tier: LRU capped at {max_bytes}. Disk tier (optional): one Parquet or Feather file per code
+# in {directory}, capped at {disk_max_bytes}, shared by every process using the same directory.
+class PriceCache:
+
+    def __init__(self, max_bytes=256 * 2 ** 20, directory=None, disk_max_bytes=2 * 2 ** 30, fmt='parquet'):
+        if fmt not in ('parquet', 'feather'):
+            raise ValueError(f'Unknown cache format: {fmt}')
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.disk_max_bytes = disk_max_bytes
+        self.fmt = fmt
+        self.entries = OrderedDict()  # code -> entry dict, least recently used first
+        self.bytes = 0
+        self.lock = threading.RLock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    # Return rows of {code} in [start, end], or None on a miss
+    def get(self, code, start, end, watermark=None):
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        with self.lock:
+            entry = self.entries.get(code)
+            if entry is None and self.directory is not None:
+                entry = self.read_disk(code)
+                if entry is not None:
+                    self.disk_hits += 1
+                    self.store(code, entry)
+            if entry is not None and self.stale(entry, end, watermark):
+                self.invalidate(code)
+                entry = None
+            if entry is None or start < entry['start'] or end > entry['end']:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(code)
+            self.hits += 1
+            dates = entry['dates']
+            return entry['frame'].iloc[dates.searchsorted(start):dates.searchsorted(end, side='right')]
+
+    # Remember rows of {code} read from DB for [start, end]; overlapping windows are merged
+    def put(self, code, frame, start, end, watermark=None):
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        with self.lock:
+            old = self.entries.get(code)
+            if old is not None and old['watermark'] == watermark \
+                    and start <= old['end'] + pd.Timedelta(days=1) and old['start'] <= end + pd.Timedelta(days=1):
+                frame = pd.concat([old['frame'], frame])
+                frame = frame[~frame.index.duplicated(keep='last')]
+                start, end = min(start, old['start']), max(end, old['end'])
+            frame = frame.sort_index()
+            entry = {'frame': frame, 'dates': pd.DatetimeIndex(pd.to_datetime(frame.index)),
+                     'start': start, 'end': end, 'watermark': watermark}
+            self.store(code, entry)
+            if self.directory is not None:
+                self.write_disk(code, entry)
+
+    # Window reaching past the watermark it was read at, while newer prices exist
+    @staticmethod
+    def stale(entry, end, watermark):
+        if watermark is None or entry['watermark'] is None:
+            return False
+        return watermark > entry['watermark'] and end > entry['watermark']
+
+    def store(self, code, entry):
+        entry['bytes'] = int(entry['frame'].memory_usage(deep=True).sum())
+        old = self.entries.pop(code, None)
+        if old is not None:
+            self.bytes -= old['bytes']
+        self.entries[code] = entry
+        self.bytes += entry['bytes']
+        while self.bytes > self.max_bytes and len(self.entries) > 1:
+            _, evicted = self.entries.popitem(last=False)
+            self.bytes -= evicted['bytes']
+            self.evictions += 1
+
+    # Drop {code}, or everything when code is None
+    def invalidate(self, code=None):
+        with self.lock:
+            codes = list(self.entries) if code is None else [code]
+            for code_ in codes:
+                entry = self.entries.pop(code_, None)
+                if entry is not None:
+                    self.bytes -= entry['bytes']
+                    self.invalidations += 1
+                if self.directory is not None:
+                    for path in self.paths(code_):
+                        if os.path.exists(path):
+                            os.remove(path)
+            # Cache files of codes not in memory; other files in the directory are left alone
+            if code is None and self.directory is not None:
+                for file_name in os.listdir(self.directory):
+                    if file_name.endswith('.' + self.fmt):
+                        for path in self.paths(file_name[:-len(self.fmt) - 1]):
+                            if os.path.exists(path):
+                                os.remove(path)
+
+    def paths(self, code):
+        return (os.path.join(self.directory, f'{code}.{self.fmt}'),
+                os.path.join(self.directory, f'{code}.json'))
+
+    # Entry of {code} on disk, None when missing or unreadable (a file left broken by a crashed process).
+    # The sidecar is read before the data file it describes, which writers replace first.
+    def read_disk(self, code):
+        data_path, meta_path = self.paths(code)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if self.fmt == 'parquet':
+                frame = pd.read_parquet(data_path)
+            else:
+                frame = pd.read_feather(data_path)
+            frame.index = frame.date
+            os.utime(data_path)  # disk LRU order
+            watermark = meta['watermark']
+            return {'frame': frame, 'dates': pd.DatetimeIndex(pd.to_datetime(frame.index)),
+                    'start': pd.Timestamp(meta['start']), 'end': pd.Timestamp(meta['end']),
+                    'watermark': None if watermark is None else pd.Timestamp(watermark)}
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f'Unreadable price cache file of {code}: {type(e).__name__}: {e}')
+            return None
+
+    # Data file first, then its sidecar, each replaced atomically: readers in other processes
+    # never see a partial file, nor a sidecar newer than its data
+    def write_disk(self, code, entry):
+        data_path, meta_path = self.paths(code)
+        frame = entry['frame'].reset_index(drop=True)
+        if self.fmt == 'parquet':
+            self.replace_file(data_path, lambda path: frame.to_parquet(path, index=False))
+        else:
+            self.replace_file(data_path, frame.to_feather)
+        watermark = entry['watermark']
+        meta = {'start': f"{entry['start']:%Y-%m-%d}", 'end': f"{entry['end']:%Y-%m-%d}",
+                'watermark': None if watermark is None else f'{watermark:%Y-%m-%d}'}
+
+        def write_meta(path):
+            with open(path, 'w') as f:
+                json.dump(meta, f)
+        self.replace_file(meta_path, write_meta)
+        self.trim_disk()
+
+    # write(temporary path) in the cache directory, then move the file to {path}
+    def replace_file(self, path, write):
+        with tempfile.NamedTemporaryFile(dir=self.directory, suffix='.tmp', delete=False) as f:
+            temp_path = f.name
+        try:
+            write(temp_path)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    # Remove least recently used files until the directory fits in {disk_max_bytes}
+    def trim_disk(self):
+        data_files = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                      if name.endswith('.' + self.fmt)]
+        data_files.sort(key=os.path.getmtime)
+        total = sum(os.path.getsize(path) for path in data_files)
+        for path in data_files[:-1]:
+            if total <= self.disk_max_bytes:
+                break
+            total -= os.path.getsize(path)
+            os.remove(path)
+            meta_path = os.path.splitext(path)[0] + '.json'
+            if os.path.exists(meta_path):
+                os.remove(meta_path)
+            self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+                    'hit_rate': self.hits / lookups if lookups else 0.0,
+                    'evictions': self.evictions, 'invalidations': self.invalidations,
+                    'entries': len(self.entries), 'bytes': self.bytes}
+
+
+shared = None
+
+
+# Process-wide cache used by PriceCheck(cache=True)
+def shared_cache():
+    global shared
+    if shared is None:
+        shared = PriceCache()
+    return shared
@@ -0,0 +1,227 @@
+import os
+import json
+import tempfile
+from contextlib import closing
+import numpy as np
+import pandas as pd
+from DBWriter import param_mark
+
+# Universe prices as dense date x code arrays in .npy files, memory-mapped by every reader process,
+# so cross-sectional work (momentum ranking, screening, covariance) shares the same pages without
+# copies or DB reads.
+# {directory}/cube.json holds the generation and the extent in use (n_dates x n_codes). Each generation
+# has the date and code index files, one array per field (NaN where there is no price) and a valid mask,
+# all with spare capacity so daily refreshes write in place. A refresh writes the values first and
+# cube.json last, atomically, so readers never see dates or codes without their values. Growing past the
+# capacity (or a date before the last one) writes the next generation; readers holding the previous one
+# keep their mapping until they reload. One process refreshes a cube at a time.
+
+FIELDS = {'open': np.float32, 'high': np.float32, 'low': np.float32, 'close': np.float32, 'volume': np.float64}
+META_FILE = 'cube.json'
+DATE_SPARE = 260  # about a year of trading days
+CODE_SPARE = 200
+CODE_DTYPE = 'U20'
+
+
+class PriceCube:
+
+    # mode: 'r' to read, 'r+' to refresh
+    def __init__(self, directory, mode='r'):
+        self.directory = directory
+        self.mode = mode
+        self.meta = None
+        self.arrays = {}
+        self.reload()
+
+    @staticmethod
+    def exists(directory):
+        return os.path.exists(os.path.join(directory, META_FILE))
+
+    @staticmethod
+    def file_path(directory, name, generation):
+        return os.path.join(directory, f'{name}.{generation}.npy')
+
+    # Re-read cube.json, mapping the files again when the generation changed.
+    # Returns True when the cube changed since the last reload.
+    def reload(self):
+        for attempt in range(3):
+            with open(os.path.join(self.directory, META_FILE)) as f:
+                meta = json.load(f)
+            if meta == self.meta:
+                return False
+            if self.meta is not None and meta['generation'] == self.meta['generation']:
+                break
+            try:
+                self.arrays = {name: np.load(self.file_path(self.directory, name, meta['generation']),
+                                             mmap_mode=self.mode)
+                               for name in ['dates', 'codes', 'valid'] + meta['fields']}
+                break
+            except FileNotFoundError:  # generation replaced while reading cube.json
+                if attempt == 2:
+                    raise
+        self.meta = meta
+        self.n_dates = meta['n_dates']
+        self.n_codes = meta['n_codes']
+        self.dates = pd.DatetimeIndex(self.arrays['dates'][:self.n_dates])
+        self.codes = self.arrays['codes'][:self.n_codes].tolist()
+        self.code_index = {code: i for i, code in enumerate(self.codes)}
+        return True
+
+    @property
+    def fields(self):
+        return self.meta['fields']
+
+    # date x code array of {field} over the dates and codes in use: a view of the mapped file, no copy
+    def field(self, field):
+        return self.arrays[field][:self.n_dates, :self.n_codes]
+
+    # date x code mask of the prices present
+    def valid(self):
+        return self.arrays['valid'][:self.n_dates, :self.n_codes]
+
+    # date x code frame of {field} over [start_date, end_date]; a view when {codes} is None
+    def frame(self, field, start_date=None, end_date=None, codes=None):
+        start = 0 if start_date is None else self.dates.searchsorted(pd.Timestamp(start_date))
+        end = self.n_dates if end_date is None else self.dates.searchsorted(pd.Timestamp(end_date), side='right')
+        values = self.field(field)[start:end]
+        if codes is None:
+            return pd.DataFrame(values, index=self.dates[start:end], columns=self.codes, copy=False)
+        codes = list(codes)
+        columns = np.array([self.code_index.get(code, -1) for code in codes], dtype=np.int64)
+        values = values[:, np.maximum(columns, 0)]
+        values[:, columns < 0] = np.nan
+        return pd.DataFrame(values, index=self.dates[start:end], columns=codes)
+
+    # Files of generation {generation} for {dates} x {codes} with spare capacity, empty: {name: array}
+    @classmethod
+    def create_files(cls, directory, dates, codes, fields, generation):
+        os.makedirs(directory, exist_ok=True)
+        shape = (len(dates) + DATE_SPARE, len(codes) + CODE_SPARE)
+        arrays = {'dates': np.lib.format.open_memmap(cls.file_path(directory, 'dates', generation), mode='w+',
+                                                     dtype='datetime64[D]', shape=(shape[0],)),
+                  'codes': np.lib.format.open_memmap(cls.file_path(directory, 'codes', generation), mode='w+',
+                                                     dtype=CODE_DTYPE, shape=(shape[1],)),
+                  'valid': np.lib.format.open_memmap(cls.file_path(directory, 'valid', generation), mode='w+',
+                                                     dtype=bool, shape=shape)}
+        arrays['dates'][:len(dates)] = pd.DatetimeIndex(dates).to_numpy(dtype='datetime64[D]')
+        arrays['codes'][:len(codes)] = codes
+        for field in fields:
+            arrays[field] = np.lib.format.open_memmap(cls.file_path(directory, field, generation), mode='w+',
+                                                      dtype=FIELDS[field], shape=shape)
+            arrays[field][:] = np.nan
+        return arrays
+
+    # Empty cube of {dates} x {codes} in {directory}, keeping prices from {start_date} on
+    @classmethod
+    def allocate(cls, directory, dates, codes, start_date=None, fields=tuple(FIELDS)):
+        for array in cls.create_files(directory, dates, codes, fields, 0).values():
+            array.flush()
+        cls.write_meta(directory, {'generation': 0, 'n_dates': len(dates), 'n_codes': len(codes),
+                                   'fields': list(fields),
+                                   'start_date': None if start_date is None else f'{pd.Timestamp(start_date):%Y-%m-%d}'})
+        return cls(directory, 'r+')
+
+    @staticmethod
+    def write_meta(directory, meta):
+        with tempfile.NamedTemporaryFile('w', dir=directory, suffix='.tmp', delete=False) as f:
+            json.dump(meta, f)
+        os.replace(f.name, os.path.join(directory, META_FILE))
+
+    # Write a long price frame (code, date and the fields) into the cube, adding its new dates and codes
+    def write(self, prices):
+        if self.meta['start_date'] is not None:
+            prices = prices[pd.to_datetime(prices.date) >= pd.Timestamp(self.meta['start_date'])]
+        if prices.empty:
+            return 0
+        dates = pd.DatetimeIndex(pd.to_datetime(prices.date))
+        new_dates = dates.unique().difference(self.dates).sort_values()
+        new_codes = sorted(set(prices.code.unique()) - set(self.code_index))
+        capacity_dates, capacity_codes = self.arrays['valid'].shape
+
+        if len(new_dates) and ((self.n_dates and new_dates[0] < self.dates[-1])
+                               or self.n_dates + len(new_dates) > capacity_dates) \
+                or self.n_codes + len(new_codes) > capacity_codes:
+            self.grow(self.dates.union(new_dates), self.codes + new_codes)
+        else:
+            self.arrays['dates'][self.n_dates:self.n_dates + len(new_dates)] = \
+                new_dates.to_numpy(dtype='datetime64[D]')
+            self.arrays['codes'][self.n_codes:self.n_codes + len(new_codes)] = new_codes
+            self.n_dates += len(new_dates)
+            self.n_codes += len(new_codes)
+            self.dates = self.dates.append(new_dates)
+            self.code_index.update({code: self.n_codes - len(new_codes) + i for i, code in enumerate(new_codes)})
+            self.codes += new_codes
+
+        rows = self.dates.get_indexer(dates)
+        columns = prices.code.map(self.code_index).to_numpy()
+        for field in self.fields:
+            self.arrays[field][rows, columns] = prices[field].to_numpy(dtype=FIELDS[field])
+        self.arrays['valid'][rows, columns] = True
+
+        for array in self.arrays.values():
+            array.flush()
+        self.write_meta(self.directory, dict(self.meta, n_dates=self.n_dates, n_codes=self.n_codes))
+        self.reload()
+        return len(prices)
+
+    # Copy the cube into the next generation over {dates} x {codes} (a superset of the current ones),
+    # {chunk} dates at a time, then switch to it and remove the previous generation
+    def grow(self, dates, codes, chunk=1000):
+        generation = self.meta['generation']
+        grown = self.create_files(self.directory, dates, codes, self.fields, generation + 1)
+        rows = pd.DatetimeIndex(dates).get_indexer(self.dates)
+        for start in range(0, len(rows), chunk):
+            block = rows[start:start + chunk]
+            for name in ['valid'] + self.fields:
+                grown[name][block, :self.n_codes] = self.arrays[name][start:start + len(block), :self.n_codes]
+        for array in grown.values():
+            array.flush()
+        del grown
+        self.write_meta(self.directory, dict(self.meta, generation=generation + 1, n_dates=len(dates),
+                                             n_codes=len(codes)))
+        self.reload()
+        for name in ['dates', 'codes', 'valid'] + self.fields:
+            try:
+                os.remove(self.file_path(self.directory, name, generation))
+            except OSError:  # still mapped by a reader on Windows
+                pass
+
+    # Materialize daily_price from {start_date} (default: all) into {directory}, {chunk_size} codes per query
+    @classmethod
+    def build(cls, connection, directory, start_date=None, chunk_size=200):
+        from TradingCalendar import TradingCalendar
+        dates = TradingCalendar.load(connection).between(start_date)
+        with closing(connection.cursor()) as cursor:
+            cursor.execute("SELECT code FROM price_watermark ORDER BY code")
+            codes = [code for code, in cursor.fetchall()]
+        cube = cls.allocate(directory, dates, codes, start_date)
+        since = None if start_date is None else pd.Timestamp(start_date) - pd.Timedelta(days=1)
+        for i in range(0, len(codes), chunk_size):
+            cube.write(cls.read_prices(connection, codes[i:i + chunk_size], since))
+        return cube
+
+    # Write the prices of {jobs} ([(code, last date before the crawl or None)]) read back from daily_price:
+    # rows after that date, or every row of codes without one
+    def refresh(self, connection, jobs, chunk_size=200):
+        start = None if self.meta['start_date'] is None else pd.Timestamp(self.meta['start_date']) - pd.Timedelta(days=1)
+        new = [code for code, since in jobs if since is None]
+        # Chunks of codes with close watermarks read from the earliest of them
+        known = sorted((since, code) for code, since in jobs if since is not None)
+        chunks = [(new[i:i + chunk_size], start) for i in range(0, len(new), chunk_size)] \
+            + [([code for _, code in known[i:i + chunk_size]], known[i][0]) for i in range(0, len(known), chunk_size)]
+        written = 0
+        for codes, since in chunks:
+            written += self.write(self.read_prices(connection, codes, since))
+        return written
+
+    # Long price frame of {codes} from daily_price, after {since} when given
+    @staticmethod
+    def read_prices(connection, codes, since=None):
+        mark = param_mark(connection)
+        sql = f"SELECT code, date, {', '.join(FIELDS)} FROM daily_price " \
+              f"WHERE code IN ({', '.join([mark] * len(codes))})"
+        params = list(codes)
+        if since is not None:
+            sql += f" AND date > {mark}"
+            params.append(f'{pd.Timestamp(since):%Y-%m-%d}')
+        return pd.read_sql(sql, connection, params=params)
@@ -1,21 +1,65 @@
+import time
 import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-from matplotlib import gridspec, rc, rcParams
 from datetime import datetime, timedelta
-from tqdm import tqdm
-import pymysql
-from selenium import webdriver
-from bs4 import BeautifulSoup
-from ChartTool import candlestick_chart
+from contextlib import closing
+from concurrent.futures import ProcessPoolExecutor
+from DBWriter import param_mark
+from DBPool import get_pool
+from PriceCache import shared_cache
+from RunMetrics import RunMetrics
+from SymbolMaster import SymbolMaster, SNAPSHOT_PATH
+from TradingCalendar import TradingCalendar, create_schema, partition_daily_price
+from CrawlQueue import CrawlQueue
+from PriceFrame import compact_price
+from PriceCube import PriceCube, FIELDS as CUBE_FIELDS
+
+# The crawler (PriceFetch, tqdm), the writer and IndicatorState are imported where they are used,
+# so a process reading prices with PriceCheck loads only pandas and the DB driver
+
+
+# Most recent trading session whose prices should be on the server at {now}.
+# Before the market opens at 9, that is the previous business day.
+def latest_session(now=None):
+    if now is None:
+        now = datetime.today()
+    day = pd.Timestamp(now.date())
+    if now.hour < 9:
+        day -= timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day
 
 
 class PriceUpdate:
 
-    def __init__(self, db_pw):
-        self.connection = pymysql.connect(
-            host='localhost', user='root', db='trading_db', password=db_pw, charset='utf8')
-        with self.connection.cursor() as cursor:
+    # workers / rate: concurrent requests and requests per second to the price server, per crawl process
+    # batch_size / commit_size: rows per INSERT statement and rows per commit
+    # base_url default: PriceFetch.SISE_URL
+    # db_pw: DB password or ConnectionPool ('infile' needs a pool made with local_infile=True).
+    # One pooled connection is held until close().
+    # metrics_path: JSON / CSV file of each run's stage timings ({run} and {time} are filled in)
+    # metrics_callback: called with every stage timing record
+    # partition: partition daily_price by year (MySQL only), adding next year's partition on each run
+    # max_attempts: crawl attempts of a stock before it is quarantined for the run
+    # cube_path: directory of the PriceCube refreshed after each crawl (built on the first one), None for none
+    def __init__(self, db_pw, workers=8, rate=20, base_url=None,
+                 batch_size=1000, commit_size=10000, write_method='multirow',
+                 metrics_path=None, metrics_callback=None, partition=False, max_attempts=3, cube_path=None):
+        from PriceFetch import SiseFetcher, SISE_URL
+        from DBWriter import BulkWriter
+        # Settings of crawl worker processes (db_pw has to be picklable: a password or a ConnectionPool)
+        self.db_pw = db_pw
+        self.settings = {'workers': workers, 'rate': rate, 'base_url': base_url, 'batch_size': batch_size,
+                         'commit_size': commit_size, 'write_method': write_method, 'max_attempts': max_attempts}
+        self.pool = get_pool(db_pw, **({'local_infile': True} if write_method == 'infile' else {}))
+        self.connection = self.pool.checkout()
+        self.fetcher = SiseFetcher(base_url=base_url or SISE_URL, workers=workers, rate=rate)
+        self.writer = BulkWriter(self.connection, batch_size, commit_size, write_method)
+        self.metrics_path = metrics_path
+        self.metrics_callback = metrics_callback
+        self.metrics = None
+        self.cube_path = cube_path
+        with closing(self.connection.cursor()) as cursor:
             cursor.execute("""
             CREATE TABLE IF NOT EXISTS company_info (
                 code VARCHAR(20),
@@ -37,12 +81,58 @@ class PriceUpdate:
                 PRIMARY KEY (code, date)
             );
             """)
+            # Last price date of each code
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS price_watermark (
+                code VARCHAR(20),
+                last_date DATE,
+                PRIMARY KEY (code)
+            );
+            """)
+            # Streaming indicator state of each code, advanced by read_recent
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS indicator_state (
+                code VARCHAR(20),
+                date DATE,
+                state TEXT,
+                PRIMARY KEY (code)
+            );
+            """)
+            # Existing DB: start watermarks from the stored prices
+            cursor.execute("""SELECT COUNT(*) FROM price_watermark""")
+            if cursor.fetchone()[0] == 0:
+                cursor.execute("""
+                INSERT INTO price_watermark (code, last_date)
+                SELECT code, MAX(date) FROM daily_price GROUP BY code
+                """)
         self.connection.commit()
-        self.code_name_match = {}
+        # Trading days of daily_price and its (date, code) index
+        create_schema(self.connection)
+        if partition:
+            partition_daily_price(self.connection)
+        # Per-stock jobs of crawl runs
+        CrawlQueue.create_table(self.connection)
+        self.queue = CrawlQueue(self.connection, max_attempts=max_attempts)
+        self.queue.purge()
+        # Date of the last listing check and version token of company_info
+        SymbolMaster.create_meta(self.connection)
         self.update_company_info()
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Stop the fetcher and return the connection to the pool
+    def close(self):
+        if getattr(self, 'connection', None) is not None:
+            self.fetcher.close()
+            self.pool.checkin(self.connection)
+            self.connection = None
+
     def __del__(self):
-        self.connection.close()
+        self.close()
 
     # Return currently listed stocks
     # noinspection PyMethodMayBeStatic
@@ -55,205 +145,342 @@ class PriceUpdate:
         stock_codes = stock_codes.sort_values(by='code')
         return stock_codes
 
-    # Reflect currently listed stocks on DB
+    # Reflect currently listed stocks on DB.
+    # Once a day the KRX listing is compared with company_info, and only listings, delistings and renames are written.
     def update_company_info(self):
-        sql = "SELECT * FROM company_info"
-        info_df = pd.read_sql(sql, self.connection)
-        for row in info_df.itertuples():
-            self.code_name_match[row.code] = row.company
-
-        with self.connection.cursor() as cursor:
-            cursor.execute("""SELECT MAX(last_update) FROM company_info""")
-            last_update = cursor.fetchone()
-            today = datetime.today().strftime('%Y-%m-%d')
-            
-            # If DB is empty or last update date is not today:
-            if last_update[0] is None or last_update[0].strftime('%Y-%m-%d') < today:
-                stock_codes = self.read_stock_code()
-                for row in stock_codes.itertuples():
-                    sql = f"REPLACE INTO company_info (code, company, last_update) VALUES " \
-                          f"('{row.code}', '{row.company}', '{today}')"
-                    cursor.execute(sql)
-                    self.code_name_match[row.code] = row.company
+        self.symbols = SymbolMaster.read(self.connection)
+        self.code_name_match = self.symbols.code_name
+
+        checked = SymbolMaster.checked(self.connection)
+        today = datetime.today().strftime('%Y-%m-%d')
+
+        # If never checked or last check date is not today:
+        if checked is None or checked < today:
+            changes = self.symbols.refresh(self.connection, self.writer, self.read_stock_code(), today)
+            self.code_name_match = self.symbols.code_name
+            print(f"company_info: {len(changes['listed'])} listed, {len(changes['delisted'])} delisted, "
+                  f"{len(changes['renamed'])} renamed")
         print('company_info DB Update Completed')
 
-    # Crawling price data up to {count} days from now
-    def read_days(self, count):
-        with self.connection.cursor() as cursor:
-            options = webdriver.ChromeOptions()
-            options.add_argument('headless')
-            # Options for speed up
-            prefs = {'profile.default_content_setting_values': {
-                'cookies': 2, 'images': 2, 'plugins': 2, 'popups': 2, 'geolocation': 2, 'notifications': 2,
-                'auto_select_certificate': 2, 'fullscreen': 2, 'mouselock': 2, 'mixed_script': 2,
-                'media_stream': 2, 'media_stream_mic': 2, 'media_stream_camera': 2, 'protocol_handlers': 2,
-                'ppapi_broker': 2, 'automatic_downloads': 2, 'midi_sysex': 2, 'push_messaging': 2,
-                'ssl_cert_decisions': 2, 'metro_switch_to_desktop': 2, 'protected_media_identifier': 2,
-                'app_banner': 2, 'site_engagement': 2, 'durable_storage': 2}}
-            options.add_experimental_option('prefs', prefs)
-            driver = webdriver.Chrome(executable_path='chromedriver', options=options)
-
-            today = datetime.today()
-            y = today.year
-            m = today.month
-            d = today.day
-
-            for number, stockcode in enumerate(tqdm(self.code_name_match.keys())):
-                url = f'https://fchart.stock.naver.com/siseJson.nhn?symbol={stockcode}&requestType=2' \
-                      f'&count={count}&startTime={y}{m:02d}{d:02d}&timeframe=day'
-                driver.get(url)
-                r = driver.page_source
-                html = BeautifulSoup(r, 'lxml')
-                split_html = str(html).split('\n\t\t\n')
-
-                columns = ['code', 'date', 'open', 'high', 'low', 'close', 'differ', 'volume']
-                last_close = 0
-                days_value_list = []
-
-                for daily_value in split_html[1:-1]:
-                    daily_value = daily_value.replace('"', '').replace(',', '').strip('[]')
-                    daily_value = daily_value.split(' ')[:-1]
-
-                    temp_columns = ['date', 'open', 'high', 'low', 'close', 'volume']
-                    temp_df = pd.DataFrame([daily_value], columns=temp_columns)
-                    temp_df[['open', 'high', 'low', 'close', 'volume']] = \
-                        temp_df[['open', 'high', 'low', 'close', 'volume']].astype('int')
-
-                    if last_close != 0:
-                        differ = (temp_df.close.values[0] / last_close - 1) * 100
-                    else:
-                        differ = 0
-
-                    differ_df = pd.DataFrame([differ], columns=['differ'])
-                    code_df = pd.DataFrame([stockcode], columns=['code'])
-                    daily_value_df = pd.concat([temp_df, code_df, differ_df], axis=1)
-                    daily_value_df = daily_value_df[columns]
-                    days_value_list.append(daily_value_df)
-
-                    last_close = int(daily_value_df.close.values[0])
-
-                days_value_df = pd.concat(days_value_list)
-                days_value_df.columns = columns
-                days_value_df = days_value_df.dropna()
-
-                for daily in days_value_df.itertuples():
-                    sql = f"REPLACE INTO daily_price VALUES ('{daily.code}', '{daily.date}', " \
-                          f"{daily.open}, {daily.high}, {daily.low}, {daily.close}, " \
-                          f"{daily.differ}, {daily.volume})"
-                    cursor.execute(sql)
-                self.connection.commit()
-
-            print('daily_price DB Update Completed')
-
-    # Crawling price data from last update date to today
-    def read_recent(self):
-        with self.connection.cursor() as cursor:
-            today = datetime.today()
-            yesterday = today - timedelta(days=1)
-            cursor.execute("""SELECT MAX(date) FROM daily_price""")
-            last_date = datetime.strptime(str(cursor.fetchone()[0]), '%Y-%m-%d')
-            recent = last_date.day == today.day \
-                or (last_date.day == yesterday.day and int(today.strftime('%H')) < 9)
-
-            if recent:
-                print('The most recent update date is today.')
-            else:
-                options = webdriver.ChromeOptions()
-                options.add_argument('headless')
-                prefs = {'profile.default_content_setting_values': {
-                    'cookies': 2, 'images': 2, 'plugins': 2, 'popups': 2, 'geolocation': 2, 'notifications': 2,
-                    'auto_select_certificate': 2, 'fullscreen': 2, 'mouselock': 2, 'mixed_script': 2,
-                    'media_stream': 2, 'media_stream_mic': 2, 'media_stream_camera': 2, 'protocol_handlers': 2,
-                    'ppapi_broker': 2, 'automatic_downloads': 2, 'midi_sysex': 2, 'push_messaging': 2,
-                    'ssl_cert_decisions': 2, 'metro_switch_to_desktop': 2, 'protected_media_identifier': 2,
-                    'app_banner': 2, 'site_engagement': 2, 'durable_storage': 2}}
-                options.add_experimental_option('prefs', prefs)
-                driver = webdriver.Chrome(executable_path='chromedriver', options=options)
-
-                no_update_term = (today - last_date).days
-
-                # Consider weekend
-                count = int(no_update_term * 5 / 7) + 2
-
-                y = today.year
-                m = today.month
-                d = today.day
-
-                for number, stockcode in enumerate(tqdm(self.code_name_match.keys())):
-                    url = f'https://fchart.stock.naver.com/siseJson.nhn?symbol={stockcode}&requestType=2' \
-                          f'&count={count}&startTime={y}{m:02d}{d:02d}&timeframe=day'
-                    driver.get(url)
-                    r = driver.page_source
-                    html = BeautifulSoup(r, 'lxml')
-                    split_html = str(html).split('\n\t\t\n')
-
-                    columns = ['code', 'date', 'open', 'high', 'low', 'close', 'differ', 'volume']
-                    last_close = 0
-                    days_value_list = []
-
-                    for daily_value in split_html[1:-1]:
-                        daily_value = daily_value.replace('"', '').replace(',', '').strip('[]')
-                        daily_value = daily_value.split(' ')[:-1]
-
-                        temp_columns = ['date', 'open', 'high', 'low', 'close', 'volume']
-                        temp_df = pd.DataFrame([daily_value], columns=temp_columns)
-                        temp_df[['open', 'high', 'low', 'close', 'volume']] = \
-                            temp_df[['open', 'high', 'low', 'close', 'volume']].astype('int')
-
-                        if last_close != 0:
-                            differ = (temp_df.close.values[0] / last_close - 1) * 100
-                        else:
-                            differ = 0
-
-                        differ_df = pd.DataFrame([differ], columns=['differ'])
-                        code_df = pd.DataFrame([stockcode], columns=['code'])
-                        daily_value_df = pd.concat([temp_df, code_df, differ_df], axis=1)
-                        daily_value_df = daily_value_df[columns]
-                        days_value_list.append(daily_value_df)
-
-                        last_close = daily_value_df.close.values[0]
-                        last_close = int(last_close)
-
-                    try:
-                        days_value_df = pd.concat(days_value_list)
-                    except ValueError:
-                        # The stock is going to be listed today
-                        # In this case, this stock's page is empty
-                        pass
-                    else:
-                        days_value_df.columns = columns
-                        days_value_df = days_value_df.dropna()
-
-                        for daily in days_value_df.itertuples():
-                            # Some intervals overlap existing data -> REPLACE instead of INSERT
-                            sql = f"REPLACE INTO daily_price VALUES ('{daily.code}', '{daily.date}', " \
-                                  f"{daily.open}, {daily.high}, {daily.low}, {daily.close}, " \
-                                  f"{daily.differ}, {daily.volume})"
-                            cursor.execute(sql)
-                        self.connection.commit()
-
-                print('daily_price DB Update Completed')
+    # Return {code: last price date} of stocks having prices in DB
+    def load_watermarks(self):
+        with closing(self.connection.cursor()) as cursor:
+            cursor.execute("""SELECT code, last_date FROM price_watermark""")
+            return {code: pd.Timestamp(last_date) for code, last_date in cursor.fetchall()}
+
+    # Advance watermarks to the last written date of each code
+    def save_watermarks(self, last_dates):
+        watermarks = self.load_watermarks()
+        rows = [(code, f'{date:%Y-%m-%d}') for code, date in last_dates.items()
+                if code not in watermarks or date > watermarks[code]]
+        self.writer.upsert('price_watermark', rows, columns=('code', 'last_date'), keys=('code',))
+        self.writer.flush()
+
+    # Add the dates of newly written prices to trading_calendar
+    def update_calendar(self, new_prices):
+        if not new_prices:
+            return 0
+        dates = pd.concat([prices.date for prices in new_prices]).unique()
+        return TradingCalendar.update(self.connection, self.writer, dates)
+
+    # Record stage timings of a run: plan, fetch (per code, with retries), parse, write, flush,
+    # watermark, calendar and indicators
+    def start_metrics(self, run):
+        metrics = RunMetrics(run, self.metrics_callback)
+        self.fetcher.on_fetch = lambda code, seconds, retries, error: \
+            metrics.record('fetch', seconds, code, retries=retries, error=error)
+        self.metrics = metrics
+        return metrics
+
+    # Summarise the run and write its metrics file
+    def finish_metrics(self):
+        self.fetcher.on_fetch = None
+        self.metrics.finish()
+        self.metrics.print_summary()
+        if self.metrics_path is not None:
+            print(f'Metrics written to {self.metrics.write(self.metrics_path)}')
+
+    # Long price frame of {codes} from daily_price, read {chunk_size} codes per query
+    def read_history(self, codes, chunk_size=500):
+        mark = param_mark(self.connection)
+        frames = [pd.DataFrame(columns=['code', 'date', 'high', 'low', 'close', 'volume'])]
+        for i in range(0, len(codes), chunk_size):
+            chunk = list(codes[i:i + chunk_size])
+            sql = f"SELECT code, date, high, low, close, volume FROM daily_price " \
+                  f"WHERE code IN ({', '.join([mark] * len(chunk))})"
+            frames.append(pd.read_sql(sql, self.connection, params=chunk))
+        return pd.concat(frames, ignore_index=True)
+
+    # Advance the indicator state of each stock by its new prices, one step per new bar.
+    # Stocks whose state is missing or behind their old watermark are rebuilt from daily_price.
+    def update_indicators(self, new_prices, watermarks):
+        from IndicatorState import IndicatorState
+        if not new_prices:
+            return
+        new_prices = pd.concat(new_prices, ignore_index=True)
+        codes = new_prices.code.unique().tolist()
+        state = IndicatorState.load(self.connection, codes)
+        dates = state.latest().date
+        behind = [code for code in codes if code not in dates.index or code not in watermarks
+                  or dates[code] < watermarks[code]]
+        state.reset(behind)
+        state.update(self.read_history(behind))
+        state.update(new_prices)
+        state.save(self.writer, codes)
+        self.writer.flush()
+        print(f'indicator_state Update Completed: {len(codes) - len(behind)} advanced, {len(behind)} rebuilt')
+
+    # Crawling price data up to {count} days from now, with {processes} worker processes.
+    # Every call crawls all stocks again; resume=True instead finishes the last unfinished read_days
+    # run of {count} with the stocks it has not done yet (a new run when there is none).
+    def read_days(self, count, processes=1, resume=False):
+        metrics = self.start_metrics('read_days')
+        prefix = f'read_days:{count}:'
+        run = self.queue.unfinished(prefix) if resume else None
+        if run is not None:
+            print(f'Resuming {run}')
+            self.crawl(run, processes)
+            return
+        run = f'{prefix}{datetime.now():%Y-%m-%d %H:%M:%S.%f}'
+        with metrics.stage('plan') as stage:
+            # Rewritten prices may differ from the ones the indicator state was built on: no watermark
+            jobs = {stockcode: (count, None) for stockcode in self.code_name_match.keys()}
+            self.queue.enqueue(run, jobs)
+            stage['rows'] = len(jobs)
+        self.crawl(run, processes)
+
+    # Crawling price data of each stock from its last price date to today, with {processes} worker processes.
+    # Stocks without prices yet get {new_count} days, stocks already up to date are skipped.
+    # A crashed run for the same session resumes with the stocks not yet done.
+    def read_recent(self, new_count=250, processes=1):
+        metrics = self.start_metrics('read_recent')
+        with metrics.stage('plan') as stage:
+            session = latest_session()
+            watermarks = self.load_watermarks()
+
+            jobs = {}
+            for stockcode in self.code_name_match.keys():
+                last_date = watermarks.get(stockcode)
+                if last_date is None:
+                    jobs[stockcode] = (new_count, None)
+                elif last_date < session:
+                    # Business days after the watermark, plus the watermark day itself for differ
+                    jobs[stockcode] = (len(pd.bdate_range(last_date + timedelta(days=1), session)) + 1, last_date)
+            stage['rows'] = len(jobs)
+
+        if not jobs:
+            print('The most recent update date is today.')
+            self.finish_metrics()
+            return
+
+        run = f"read_recent:{session:%Y-%m-%d}"
+        self.queue.enqueue(run, jobs)
+        self.crawl(run, processes)
+
+    # Work through the jobs of {run} with {processes} worker processes, this one included, then report
+    # the run's jobs and its quarantined stocks
+    def crawl(self, run, processes=1):
+        futures = []
+        executor = ProcessPoolExecutor(processes - 1) if processes > 1 else None
+        if executor is not None:
+            futures = [executor.submit(crawl_worker, self.db_pw, run, self.settings) for _ in range(processes - 1)]
+        try:
+            self.work(run)
+        finally:
+            for future in futures:
+                try:
+                    self.metrics.merge(future.result())
+                except Exception as e:  # its claimed jobs are taken over once their lease expires
+                    print(f'Crawl worker failed: {type(e).__name__}: {e}')
+            if executor is not None:
+                executor.shutdown()
+
+        counts = self.queue.counts(run)
+        print(f"{run}: {counts['done']} done, {counts['failed']} failed, "
+              f"{counts['pending'] + counts['running']} left")
+        failed = self.queue.failed(run)
+        if not failed.empty:
+            print(f'Quarantined after {self.queue.max_attempts} attempts:')
+            print(failed.to_string(index=False))
+        if self.cube_path is not None:
+            with self.metrics.stage('cube') as stage:
+                stage['rows'] = self.refresh_cube(run)
+        self.finish_metrics()
+
+    # Bring the price cube up to date with the stocks {run} crawled, by every worker process
+    def refresh_cube(self, run):
+        if not PriceCube.exists(self.cube_path):
+            cube = PriceCube.build(self.connection, self.cube_path)
+            print(f'Price cube built: {cube.n_dates} dates x {cube.n_codes} stocks')
+            return int(cube.valid().sum())
+        rows = PriceCube(self.cube_path, 'r+').refresh(self.connection, self.queue.done(run))
+        print(f'Price cube refreshed: {rows} prices')
+        return rows
+
+    # Crawl jobs of {run} claimed from the queue, {claim_size} stocks at a time, until none are left.
+    # Jobs are marked done once their prices and watermarks are committed; a stock whose page
+    # fails to download or parse goes back to the queue, and is quarantined when its attempts run out.
+    def work(self, run, claim_size=100):
+        from tqdm import tqdm
+        metrics = self.metrics
+        counts = self.queue.counts(run)
+        progress = tqdm(total=counts['pending'] + counts['running'])
+        watermarks = {}
+        new_prices = []
+        n_done = 0
+
+        while True:
+            with metrics.stage('claim') as stage:
+                jobs = self.queue.claim(run, claim_size)
+                stage['rows'] = len(jobs)
+            if not jobs:
+                break
+            try:
+                n_done += self.work_jobs(run, jobs, progress, watermarks, new_prices)
+            except BaseException:
+                # Uncommitted prices are dropped; their jobs go back to the queue
+                self.writer.discard()
+                self.queue.release(run)
+                raise
+
+        progress.close()
+        with metrics.stage('calendar') as stage:
+            stage['rows'] = self.update_calendar(new_prices)
+        self.writer.print_report()
+        print(f'daily_price DB Update Completed: {len(new_prices)} of {n_done} stocks had new prices')
+        with metrics.stage('indicators') as stage:
+            self.update_indicators(new_prices, watermarks)
+            stage['rows'] = len(new_prices)
+
+    # Crawl one claimed batch of jobs: write their prices and watermarks, then mark them done or failed.
+    # Returns the number of jobs done; new prices and the watermarks they start from are collected
+    # into {new_prices} and {watermarks} for the indicators.
+    def work_jobs(self, run, jobs, progress, watermarks, new_prices):
+        from PriceFetch import parse_sise_json
+        metrics = self.metrics
+        since = {stockcode: last_date for stockcode, _, last_date in jobs}
+        fetched = self.fetcher.fetch_many(since.keys(), {stockcode: count for stockcode, count, _ in jobs})
+        last_dates = {}
+        done = []
+        failed = {}
+
+        for stockcode, r, error in fetched:
+            progress.update()
+            if error is None:
+                try:
+                    with metrics.stage('parse', stockcode) as stage:
+                        days_value_df = parse_sise_json(r, stockcode)
+
+                        # Only rows after the watermark are new
+                        if since[stockcode] is not None:
+                            days_value_df = days_value_df[days_value_df.date > since[stockcode]]
+                        stage['rows'] = len(days_value_df)
+                except Exception as e:
+                    error = e
+            if error is not None:
+                print(f'{stockcode}: {error}')
+                failed[stockcode] = error
+                continue
+
+            # The stock is going to be listed today
+            # In this case, this stock's page is empty
+            if not days_value_df.empty:
+                with metrics.stage('write', stockcode) as stage:
+                    self.writer.upsert('daily_price', days_value_df, keys=('code', 'date'))
+                    stage['rows'] = len(days_value_df)
+                last_dates[stockcode] = days_value_df.date.iloc[-1]
+                new_prices.append(days_value_df)
+                if since[stockcode] is not None:
+                    watermarks[stockcode] = since[stockcode]
+            done.append(stockcode)
+
+        # Watermarks only move after their prices are written, jobs are done after both
+        with metrics.stage('flush'):
+            self.writer.flush()
+        with metrics.stage('watermark') as stage:
+            self.save_watermarks(last_dates)
+            stage['rows'] = len(last_dates)
+        with metrics.stage('queue') as stage:
+            self.queue.finish(run, done, failed)
+            stage['rows'] = len(done) + len(failed)
+        return len(done)
+
+
+# Worker process of PriceUpdate.crawl, with its own connection, fetcher and rate limit.
+# Returns its stage timing records, for the metrics of the run in the parent process.
+def crawl_worker(db_pw, run, settings):
+    with PriceUpdate(db_pw, **settings) as update:
+        metrics = update.start_metrics(run)
+        update.work(run)
+        return metrics.records
 
 
 class PriceCheck:
 
-    def __init__(self, db_pw):
-        self.connection = pymysql.connect(
-            host='localhost', user='root', db='trading_db', password=db_pw, charset='utf8')
-        self.code_name_match = {}
+    # db_pw: DB password or ConnectionPool; a connection is checked out for each read
+    # cache: PriceCache to read through, or True for the process-wide one
+    # watermark_ttl: seconds between reloads of price_watermark, which invalidates cached windows
+    # symbol_snapshot: file caching company_info across processes (None: read it from DB)
+    # cube_path: PriceCube directory get_prices reads date x stock matrices from, instead of the DB
+    def __init__(self, db_pw, cache=None, watermark_ttl=60, symbol_snapshot=SNAPSHOT_PATH, cube_path=None):
+        self.pool = get_pool(db_pw)
+        self.cache = shared_cache() if cache is True else cache
+        self.watermark_ttl = watermark_ttl
+        self.watermarks = {}
+        self.watermark_time = None
+        self.calendar = None
+        self.calendar_time = None
+        self.cube_path = cube_path
+        self.cube = None
+        self.cube_time = None
+        self.symbol_snapshot = symbol_snapshot
         self.get_company_info()
 
-    def __del__(self):
-        self.connection.close()
-
-    # Reflect currently listed stocks on DB
+    # Reflect currently listed stocks on DB: one token query when the loaded symbols are current
     def get_company_info(self):
-        info_df = pd.read_sql("SELECT * FROM company_info", self.connection)
-        for row in info_df.itertuples():
-            self.code_name_match[row.code] = row.company
-
-    # Return price data of input
-    def get_price(self, code=None, name=None, start_date=None, end_date=None):
+        with self.pool.connection() as connection:
+            self.symbols = SymbolMaster.load(connection, self.symbol_snapshot)
+        self.code_name_match = self.symbols.code_name
+
+    # Last price date of {code} written by PriceUpdate
+    def watermark(self, code):
+        now = time.monotonic()
+        if self.watermark_time is None or now - self.watermark_time > self.watermark_ttl:
+            with self.pool.connection() as connection, closing(connection.cursor()) as cursor:
+                cursor.execute("""SELECT code, last_date FROM price_watermark""")
+                self.watermarks = {code_: pd.Timestamp(last_date) for code_, last_date in cursor.fetchall()}
+            self.watermark_time = now
+        return self.watermarks.get(code)
+
+    # Trading days of daily_price, reloaded like the watermarks
+    def get_calendar(self):
+        now = time.monotonic()
+        if self.calendar_time is None or now - self.calendar_time > self.watermark_ttl:
+            with self.pool.connection() as connection:
+                self.calendar = TradingCalendar.load(connection)
+            self.calendar_time = now
+        return self.calendar
+
+    # Memory-mapped PriceCube at cube_path, checked for refreshes like the watermarks
+    def get_cube(self):
+        now = time.monotonic()
+        if self.cube is None:
+            self.cube = PriceCube(self.cube_path)
+            self.cube_time = now
+        elif now - self.cube_time > self.watermark_ttl:
+            self.cube.reload()
+            self.cube_time = now
+        return self.cube
+
+    # Latest indicator values of {codes} (default: all) kept by PriceUpdate.read_recent, indexed by code
+    def get_indicators(self, codes=None):
+        from IndicatorState import IndicatorState
+        with self.pool.connection() as connection:
+            return IndicatorState.load(connection, codes).latest(codes)
+
+    # Return price data of input.
+    # compact: PriceFrame.compact_price frame (float32 / int32 columns, date index, code / name / dates in .attrs)
+    def get_price(self, code=None, name=None, start_date=None, end_date=None, compact=False):
         # start_date default: one year ago, end_date default: today
         if start_date is None:
             one_year_ago = datetime.today() - timedelta(days=365)
@@ -264,18 +491,71 @@ class PriceCheck:
         # User will input either code or name
         # If input name, match code / else ok
         if code is None:
-            for stockcode, stockname in self.code_name_match.items():
-                if stockname == name:
-                    code = stockcode
-
-        sql = f"SELECT * FROM daily_price " \
-              f"WHERE code = '{code}' and date >= '{start_date}' and date <= '{end_date}'"
-        price_df = pd.read_sql(sql, self.connection)
-        price_df.index = price_df.date
+            code = self.symbols.code(name)
+
+        price_df = None
+        if self.cache is not None:
+            watermark = self.watermark(code)
+            price_df = self.cache.get(code, start_date, end_date, watermark)
+
+        if price_df is None:
+            with self.pool.connection() as connection:
+                mark = param_mark(connection)
+                sql = f"SELECT * FROM daily_price WHERE code = {mark} and date >= {mark} and date <= {mark}"
+                price_df = pd.read_sql(sql, connection, params=(code, start_date, end_date))
+            price_df.index = price_df.date
+            if self.cache is not None:
+                self.cache.put(code, price_df, start_date, end_date, watermark)
+        if compact:
+            return compact_price(price_df, code, name or self.symbols.name(code), start_date, end_date)
+        price_df = price_df.copy()
 
         price_df['code'] = code
         price_df['name'] = name
         price_df['start_date'] = start_date
         price_df['end_date'] = end_date
 
-        return price_df
\ No newline at end of file
+        return price_df
+
+    # Return prices of many stocks with one query.
+    # codes / names: stocks to read, all stocks when both are None
+    # field: column of the date x stock matrix to return ('close', 'volume', ...), or None for the long format
+    # columns: label the matrix columns by 'code' or 'name'
+    def get_prices(self, codes=None, names=None, start_date=None, end_date=None, field='close', columns='code'):
+        if start_date is None:
+            one_year_ago = datetime.today() - timedelta(days=365)
+            start_date = one_year_ago.strftime('%Y-%m-%d')
+        if end_date is None:
+            end_date = datetime.today().strftime('%Y-%m-%d')
+
+        if codes is None and names is not None:
+            codes = [self.symbols.name_code[name] for name in names]
+
+        # Matrices of the cube's fields are read from the memory-mapped cube (float prices) without DB access
+        if self.cube_path is not None and field in CUBE_FIELDS:
+            matrix = self.get_cube().frame(field, start_date, end_date, codes).dropna(how='all')
+            if codes is None:
+                matrix = matrix.dropna(axis=1, how='all').sort_index(axis=1)
+            matrix.index.name = 'date'
+        else:
+            with self.pool.connection() as connection:
+                mark = param_mark(connection)
+                sql = f"SELECT * FROM daily_price WHERE date >= {mark} and date <= {mark}"
+                params = [start_date, end_date]
+                if codes is not None:
+                    sql += f" and code IN ({', '.join([mark] * len(codes))})"
+                    params += list(codes)
+                prices = pd.read_sql(sql, connection, params=params)
+            prices['date'] = pd.to_datetime(prices.date)
+            prices = prices.sort_values(['code', 'date'], ignore_index=True)
+
+            if field is None:
+                return prices
+            matrix = prices.pivot(index='date', columns='code', values=field)
+
+        if codes is not None:
+            matrix = matrix.reindex(columns=list(codes))
+        if columns == 'name':
+            matrix.columns = [self.code_name_match.get(code, code) for code in matrix.columns]
+        matrix.columns.name = columns
+        return matrix
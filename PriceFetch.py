@@ -0,0 +1,171 @@
+import re
+import time
+import random
+import threading
+from datetime import datetime
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+SISE_URL = 'https://fchart.stock.naver.com/siseJson.nhn'
+
+# Status codes worth retrying: throttling and temporary server errors
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+PRICE_COLUMNS = ['code', 'date', 'open', 'high', 'low', 'close', 'differ', 'volume']
+
+# One daily row of a siseJson page: ["20210104", open, high, low, close, volume, foreign ratio]
+ROW_PATTERN = re.compile(r'\[\s*["\']?(\d{8})["\']?' + r'\s*,\s*([-\d.]+)' * 5)
+
+
+# Parse a raw siseJson page into one typed frame in a single pass.
+# differ: close change from the previous row in %, 0 for the first row
+def parse_sise_json(text, code):
+    rows = ROW_PATTERN.findall(text)
+    # Empty page (listed today): no rows, typed like a full page so date filters still apply
+    values = np.array(rows, dtype=str).reshape(len(rows), 6)
+    ohlcv = values[:, 1:].astype(np.float64).astype(np.int64)
+    close = ohlcv[:, 3]
+    last_close = close[:-1]
+    # 0 on the first day and after a zero close (halted day), like the row-by-row parser
+    differ = np.zeros(len(close))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        differ[1:] = np.where(last_close != 0, (close[1:] / last_close - 1) * 100, 0)
+
+    return pd.DataFrame({
+        'code': code,
+        'date': pd.to_datetime(values[:, 0], format='%Y%m%d'),
+        'open': ohlcv[:, 0],
+        'high': ohlcv[:, 1],
+        'low': ohlcv[:, 2],
+        'close': close,
+        'differ': differ,
+        'volume': ohlcv[:, 4]
+    }, columns=PRICE_COLUMNS)
+
+
+# Token bucket per host, shared by all worker threads
+class RateLimiter:
+
+    def __init__(self, rate=None, burst=1):
+        self.rate = rate  # requests per second, None means unlimited
+        self.burst = burst
+        self.lock = threading.Lock()
+        self.buckets = {}  # host -> (tokens, last refill time)
+
+    def wait(self, host):
+        if not self.rate:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                tokens, last = self.buckets.get(host, (self.burst, now))
+                tokens = min(self.burst, tokens + (now - last) * self.rate)
+                if tokens >= 1:
+                    self.buckets[host] = (tokens - 1, now)
+                    return
+                self.buckets[host] = (tokens, now)
+                delay = (1 - tokens) / self.rate
+            time.sleep(delay)
+
+
+# Concurrent fetcher for Naver siseJson pages.
+# Each worker thread keeps its own keep-alive session, so connections are reused across codes.
+# on_fetch(code, seconds, retries, error) is called after every fetch, from the worker thread.
+class SiseFetcher:
+
+    def __init__(self, base_url=SISE_URL, workers=8, rate=20, burst=None,
+                 retries=3, backoff=0.5, timeout=10, on_fetch=None):
+        self.base_url = base_url
+        self.on_fetch = on_fetch
+        self.workers = workers
+        self.limiter = RateLimiter(rate, burst if burst is not None else workers)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.host = urlparse(base_url).netloc
+        self.local = threading.local()
+        self.sessions = []
+        self.sessions_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        with self.sessions_lock:
+            for session in self.sessions:
+                session.close()
+            self.sessions = []
+
+    def session(self):
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self.local.session = session
+            with self.sessions_lock:
+                self.sessions.append(session)
+        return session
+
+    # Query string of the original crawler: {count} days up to {end_date}
+    # noinspection PyMethodMayBeStatic
+    def params(self, code, count, end_date=None):
+        if end_date is None:
+            end_date = datetime.today()
+        return {'symbol': code, 'requestType': 2, 'count': count,
+                'startTime': end_date.strftime('%Y%m%d'), 'timeframe': 'day'}
+
+    # Return raw page text of one code, retrying with exponential backoff
+    def fetch(self, code, count, end_date=None):
+        params = self.params(code, count, end_date)
+        attempt = 0
+        start = time.perf_counter()
+        error = None
+        try:
+            while True:
+                self.limiter.wait(self.host)
+                try:
+                    response = self.session().get(self.base_url, params=params, timeout=self.timeout)
+                    if response.status_code in RETRY_STATUS:
+                        raise requests.HTTPError(f'{response.status_code} for {code}', response=response)
+                    response.raise_for_status()
+                    return response.text
+                except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+                    status = getattr(e.response, 'status_code', None)
+                    if attempt >= self.retries or (status is not None and status not in RETRY_STATUS):
+                        raise
+                    delay = self.backoff * 2 ** attempt * (1 + random.random())
+                    retry_after = e.response.headers.get('Retry-After') if e.response is not None else None
+                    if retry_after is not None and retry_after.isdigit():
+                        delay = max(delay, int(retry_after))
+                    time.sleep(delay)
+                    attempt += 1
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if self.on_fetch is not None:
+                self.on_fetch(code, time.perf_counter() - start, attempt, error)
+
+    # Fetch many codes concurrently. count is an int or a {code: count} dict.
+    # Yield (code, text, error) in completion order; error is None on success.
+    def fetch_many(self, codes, count, end_date=None):
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {}
+            for code in codes:
+                code_count = count[code] if isinstance(count, dict) else count
+                futures[executor.submit(self.fetch, code, code_count, end_date)] = code
+            for future in as_completed(futures):
+                code = futures[future]
+                try:
+                    yield code, future.result(), None
+                except Exception as e:
+                    yield code, None, e
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+# Compact price frame of one stock: float32 prices, int32 volume (int64 when a volume does not fit),
+# a datetime64 index named 'date', and code / name / start_date / end_date stored once in .attrs
+# instead of repeated on every row. float32 holds every integer price below 16,777,216 exactly.
+
+PRICE_DTYPES = {'open': np.float32, 'high': np.float32, 'low': np.float32, 'close': np.float32,
+                'differ': np.float32, 'volume': np.int32}
+META = ('code', 'name', 'start_date', 'end_date')
+
+
+# Compact frame of a price frame shaped like PriceCheck.get_price (or any frame with a date column / index)
+def compact_price(price, code=None, name=None, start_date=None, end_date=None):
+    compact = pd.DataFrame(index=pd.DatetimeIndex(price_dates(price), name='date').astype('datetime64[ns]'))
+    for column, dtype in PRICE_DTYPES.items():
+        if column not in price.columns:
+            continue
+        values = price[column].to_numpy()
+        if column == 'volume' and len(values) and values.max() > np.iinfo(np.int32).max:
+            dtype = np.int64
+        compact[column] = values.astype(dtype)
+
+    info = dict(zip(META, price_info(price)))
+    for key, value in zip(META, (code, name, start_date, end_date)):
+        if value is not None:
+            info[key] = value
+    compact.attrs.update(info)
+    return compact
+
+
+# Dates of a price frame: its date column, or its index
+def price_dates(price):
+    return pd.to_datetime(np.asarray(price.date if 'date' in price.columns else price.index))
+
+
+# (code, name, start_date, end_date) of a compact frame, or of a frame carrying them as columns
+def price_info(price):
+    if all(key in price.attrs for key in META):
+        return tuple(price.attrs[key] for key in META)
+    return tuple(price[key].iloc[0] if key in price.columns and len(price) else price.attrs.get(key)
+                 for key in META)
+
+
+# Bytes held by a frame, object columns and index included
+def memory_bytes(price):
+    return int(price.memory_usage(index=True, deep=True).sum())
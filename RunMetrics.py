@@ -0,0 +1,105 @@
+import os
+import csv
+import json
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+import numpy as np
+
+RECORD_COLUMNS = ['stage', 'code', 'seconds', 'rows', 'retries', 'error']
+PERCENTILES = (50, 90, 99)
+
+
+# Stage timings of one PriceUpdate run: one record per (stage, code) with seconds, rows, retries and error.
+# Records may come from several threads. callback(record) is called for every record, for outside collectors.
+class RunMetrics:
+
+    def __init__(self, run, callback=None):
+        self.run = run
+        self.callback = callback
+        self.records = []
+        self.lock = threading.Lock()
+        self.started = datetime.now()
+        self.start = time.perf_counter()
+        self.seconds = None
+
+    def record(self, stage, seconds, code=None, rows=0, retries=0, error=None):
+        record = {'stage': stage, 'code': code, 'seconds': seconds, 'rows': int(rows), 'retries': int(retries),
+                  'error': None if error is None else f'{type(error).__name__}: {error}'}
+        with self.lock:
+            self.records.append(record)
+        if self.callback is not None:
+            self.callback(record)
+        return record
+
+    # Add records made elsewhere (e.g. by a crawl worker process) to this run
+    def merge(self, records):
+        with self.lock:
+            self.records.extend(records)
+        if self.callback is not None:
+            for record in records:
+                self.callback(record)
+
+    # with metrics.stage('parse', code) as stage: ...; stage['rows'] = n
+    # Failures are recorded with their error and re-raised.
+    @contextmanager
+    def stage(self, stage, code=None):
+        counts = {'rows': 0, 'retries': 0}
+        start = time.perf_counter()
+        try:
+            yield counts
+        except Exception as e:
+            self.record(stage, time.perf_counter() - start, code, counts['rows'], counts['retries'], e)
+            raise
+        self.record(stage, time.perf_counter() - start, code, counts['rows'], counts['retries'])
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self.start
+
+    # Per stage: count, total seconds, rows, retries, failures and percentiles of the seconds
+    def summary(self):
+        with self.lock:
+            records = list(self.records)
+        stages = {}
+        for record in records:
+            stages.setdefault(record['stage'], []).append(record)
+        summary = {}
+        for stage, stage_records in stages.items():
+            seconds = np.array([record['seconds'] for record in stage_records])
+            summary[stage] = {'count': len(stage_records), 'total_sec': float(seconds.sum()),
+                              'rows': sum(record['rows'] for record in stage_records),
+                              'retries': sum(record['retries'] for record in stage_records),
+                              'failures': sum(record['error'] is not None for record in stage_records)}
+            for q, value in zip(PERCENTILES, np.percentile(seconds, PERCENTILES)):
+                summary[stage][f'p{q}_sec'] = float(value)
+            summary[stage]['max_sec'] = float(seconds.max())
+        return summary
+
+    def print_summary(self):
+        print(f"{self.run}: {self.seconds or time.perf_counter() - self.start:.1f}s")
+        for stage, stat in self.summary().items():
+            print(f"  {stage:<10} n={stat['count']:<6} total={stat['total_sec']:8.2f}s "
+                  f"p50={stat['p50_sec'] * 1000:8.1f}ms p90={stat['p90_sec'] * 1000:8.1f}ms "
+                  f"p99={stat['p99_sec'] * 1000:8.1f}ms rows={stat['rows']:<8} retries={stat['retries']:<4} "
+                  f"failures={stat['failures']}")
+
+    # Write to {path}: '.csv' gets one line per record, anything else JSON with the summary and records.
+    # {run} and {time} in the path are replaced by the run name and its start time.
+    def write(self, path):
+        path = path.format(run=self.run, time=f'{self.started:%Y%m%d_%H%M%S}')
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self.lock:
+            records = list(self.records)
+        if path.endswith('.csv'):
+            with open(path, 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=RECORD_COLUMNS)
+                writer.writeheader()
+                writer.writerows(records)
+        else:
+            with open(path, 'w') as f:
+                json.dump({'run': self.run, 'started': self.started.isoformat(timespec='seconds'),
+                           'seconds': self.seconds, 'summary': self.summary(), 'records': records}, f, indent=1)
+        return path
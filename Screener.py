@@ -0,0 +1,125 @@
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from PriceDB import PriceCheck
+from Signal import BOLLINGER_COLUMNS, bollinger_arrays, triple_screen_arrays, \
+    trend_rule, reversal_rule, triple_screen_rule
+
+SCREEN_COLUMNS = ['code', 'name', 'date', 'close', 'trend', 'reversal', 'triple_screen',
+                  'score', 'pb', 'mfi', 'iip', 'pd']
+
+
+# Stack one column of a long price frame sorted by (code, date) into a (day x code) array.
+# Each stock's own trading days are aligned at the bottom and padded with NaN at the top,
+# so the 2-D indicator kernels give exactly the per-stock results of BollingerBand / TripleScreen.
+def stack_bottom(chunk, column, codes, positions, length):
+    values = np.full((length, codes.max() + 1), np.nan)
+    values[positions, codes] = chunk[column].to_numpy(dtype=np.float64)
+    return values
+
+
+def side(buy, sell):
+    return np.where(buy, 'buy', np.where(sell, 'sell', ''))
+
+
+# Signals on each stock's last day for a long price frame of some stocks, as screen table rows
+def screen_chunk(chunk):
+    codes, code_labels = pd.factorize(chunk.code, sort=False)
+    counts = np.bincount(codes)
+    length = counts.max()
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    positions = length - counts[codes] + np.arange(len(codes)) - starts[codes]
+    high, low, close, volume = [stack_bottom(chunk, column, codes, positions, length)
+                                for column in ('high', 'low', 'close', 'volume')]
+
+    bb = {column: values[-1] for column, values in bollinger_arrays(high, low, close, volume).items()}
+    ts = triple_screen_arrays(high, low, close)
+
+    if length > 1:
+        last_ema130, last_pd = ts['ema130'][-2], ts['pd'][-2]
+    else:
+        last_ema130 = last_pd = np.full(len(code_labels), np.nan)
+    return signal_table(code_labels, chunk.date.to_numpy()[starts + counts - 1], close[-1], bb,
+                        ts['ema130'][-1], last_ema130, ts['pd'][-1], last_pd)
+
+
+# Screen table rows of the stocks having any signal, from their latest indicator values
+def signal_table(codes, dates, close, bb, ema130, last_ema130, pd_, last_pd):
+    # BollingerBand drops days with any missing indicator
+    bb_valid = np.all([~np.isnan(bb[column]) for column in BOLLINGER_COLUMNS], axis=0)
+    trend_buy, trend_sell = trend_rule(bb['pb'], bb['mfi'])
+    reversal_buy, reversal_sell = reversal_rule(bb['pb'], bb['iip'])
+    ts_buy, ts_sell = triple_screen_rule(ema130, last_ema130, pd_, last_pd)
+
+    table = pd.DataFrame({
+        'code': codes,
+        'date': dates,
+        'close': close,
+        'trend': side(trend_buy & bb_valid, trend_sell & bb_valid & ~trend_buy),
+        'reversal': side(reversal_buy & bb_valid, reversal_sell & bb_valid & ~reversal_buy),
+        'triple_screen': side(ts_buy, ts_sell & ~ts_buy),
+        'pb': np.where(bb_valid, bb['pb'], np.nan),
+        'mfi': np.where(bb_valid, bb['mfi'], np.nan),
+        'iip': np.where(bb_valid, bb['iip'], np.nan),
+        'pd': pd_
+    })
+    score = np.zeros(len(table), dtype=int)
+    for strategy in ('trend', 'reversal', 'triple_screen'):
+        score += (table[strategy] == 'buy').to_numpy().astype(int) - (table[strategy] == 'sell').to_numpy()
+    table['score'] = score
+    return table[(table.trend != '') | (table.reversal != '') | (table.triple_screen != '')]
+
+
+# Screen a long-format price frame (code, date, open, high, low, close, volume) of many stocks.
+# Codes are sharded into chunks of {chunk_size} over {workers} processes (1: no pool).
+# Only stocks priced on the latest date of the whole frame count.
+# The table is ranked by score (buy signals - sell signals), then by %B.
+def screen_prices(prices, code_name_match=None, workers=None, chunk_size=100):
+    prices = prices.sort_values(['code', 'date'], ignore_index=True)
+    last_dates = prices.groupby('code', sort=False).date.transform('max')
+    prices = prices[last_dates == prices.date.max()]
+
+    codes = prices.code.unique()
+    chunks = [prices[prices.code.isin(codes[i:i + chunk_size])] for i in range(0, len(codes), chunk_size)]
+
+    if workers == 1:
+        results = list(map(screen_chunk, chunks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(screen_chunk, chunks))
+
+    table = pd.concat(results, ignore_index=True) if results else pd.DataFrame(columns=SCREEN_COLUMNS)
+    return rank(table, code_name_match)
+
+
+def rank(table, code_name_match=None):
+    if code_name_match is not None:
+        table['name'] = table.code.map(code_name_match)
+    table = table.reindex(columns=SCREEN_COLUMNS)
+    table = table.sort_values(['score', 'pb'], ascending=[False, False]).reset_index(drop=True)
+    return table
+
+
+# Screen the latest indicator values kept by IndicatorState (PriceCheck.get_indicators),
+# without reading any price history
+def screen_latest(latest, code_name_match=None):
+    latest = latest[latest.date == latest.date.max()]
+    table = signal_table(latest.index.to_numpy(), latest.date.to_numpy(), latest.close.to_numpy(),
+                         {column: latest[column].to_numpy() for column in BOLLINGER_COLUMNS},
+                         latest.ema130.to_numpy(), latest.last_ema130.to_numpy(),
+                         latest.pd.to_numpy(), latest.last_pd.to_numpy())
+    return rank(table.reset_index(drop=True), code_name_match)
+
+
+# Scan every stock in company_info for today's trend, reversal and triple screen signals.
+# Prices of [start_date, end_date] (default: one year up to today) are read in one query.
+# incremental: use the indicator state kept up to date by PriceUpdate.read_recent instead
+def screen(db_pw, start_date=None, end_date=None, workers=None, chunk_size=100, codes=None, incremental=False):
+    if start_date is None:
+        start_date = (datetime.today() - timedelta(days=365)).strftime('%Y-%m-%d')
+    pc = PriceCheck(db_pw)
+    if incremental:
+        return screen_latest(pc.get_indicators(codes), pc.code_name_match)
+    prices = pc.get_prices(codes, start_date=start_date, end_date=end_date, field=None)
+    return screen_prices(prices, pc.code_name_match, workers, chunk_size)
@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+import Indicator as indicator
+
+# Signal frames: one row per signal with date, side ('buy' / 'sell'), close price
+# and the indicator values that triggered it. No plotting library is needed here.
+
+
+BOLLINGER_COLUMNS = ['ma', 'stdev', 'upperbb', 'lowerbb', 'pb', 'tp', 'pmf', 'nmf', 'mfi', 'ii', 'iip']
+TRIPLE_SCREEN_COLUMNS = ['ema60', 'ema130', 'macd', 'signal', 'macd_hist', 'pk', 'pd']
+
+
+# Bollinger Band, %B, MFI and II% as {column: values}.
+# Inputs are 1-D arrays or 2-D (date x code) arrays with NaN before each stock's first day.
+def bollinger_arrays(high, low, close, volume):
+    indc = {}
+
+    # Calcluate Bollinger Band, 20-day moving average and std
+    indc['ma'], indc['stdev'], indc['upperbb'], indc['lowerbb'] = indicator.bollinger_band(close, 20, 2)
+
+    # %B indicator
+    indc['pb'] = indicator.percent_b(close, indc['upperbb'], indc['lowerbb'])
+
+    # Calculate MFI(Money Flow Index)
+    indc['tp'], indc['pmf'], indc['nmf'], indc['mfi'] = indicator.money_flow_index(high, low, close, volume, 10)
+
+    # Calculate II(Intraday Intensity), II%
+    indc['ii'], indc['iip'] = indicator.intraday_intensity(high, low, close, volume, 21)
+    return indc
+
+
+# MACD and stochastic used by Triple Screen Trading as {column: values}
+def triple_screen_arrays(high, low, close):
+    indc = {}
+
+    # macd: exponential moving averages of 12 weeks and 26 weeks, moving average convergence divergence
+    indc['ema60'], indc['ema130'], indc['macd'], indc['signal'], indc['macd_hist'] = \
+        indicator.macd(close, 60, 130, 45)
+
+    # stochastic: %K, %D
+    indc['pk'], indc['pd'] = indicator.stochastic(high, low, close, 14, 3)
+    return indc
+
+
+def price_arrays(price, columns):
+    return [price[column].to_numpy(dtype=np.float64) for column in columns]
+
+
+# Bollinger Band, %B, MFI and II% of a price frame (BollingerBand.indc before dropna)
+def bollinger_indicators(price):
+    indc = bollinger_arrays(*price_arrays(price, ['high', 'low', 'close', 'volume']))
+    return pd.DataFrame(indc, index=price.index, columns=BOLLINGER_COLUMNS)
+
+
+# MACD and stochastic of a price frame used by Triple Screen Trading
+def triple_screen_indicators(price):
+    indc = triple_screen_arrays(*price_arrays(price, ['high', 'low', 'close']))
+    return pd.DataFrame(indc, index=price.index, columns=TRIPLE_SCREEN_COLUMNS)
+
+
+# Signal rules return (buy, sell) masks of the same shape as their inputs
+
+# Trend Trading: buy when %B > 0.8 and MFI > 80, sell when %B < 0.2 and MFI < 20
+def trend_rule(pb, mfi):
+    with np.errstate(invalid='ignore'):
+        return (pb > 0.8) & (mfi > 80), (pb < 0.2) & (mfi < 20)
+
+
+# Reversal Trading: buy when %B < 0.05 and II% > 0, sell when %B > 0.95 and II% < 0
+def reversal_rule(pb, iip):
+    with np.errstate(invalid='ignore'):
+        return (pb < 0.05) & (iip > 0), (pb > 0.95) & (iip < 0)
+
+
+# Triple Screen Trading: buy when EMA130 falls and %D crosses below 20,
+# sell when EMA130 rises and %D crosses above 80
+def triple_screen_rule(ema130, last_ema130, pd_, last_pd):
+    with np.errstate(invalid='ignore'):
+        buy = (ema130 < last_ema130) & (last_pd >= 20) & (pd_ < 20)
+        sell = (ema130 > last_ema130) & (last_pd <= 80) & (pd_ > 80)
+    return buy, sell
+
+
+def signal_frame(price, indc, buy, sell, columns):
+    buy = np.asarray(buy, dtype=bool)
+    sell = np.asarray(sell, dtype=bool) & ~buy
+    rows = buy | sell
+    signals = pd.DataFrame({
+        'date': indc.index[rows],
+        'side': np.where(buy[rows], 'buy', 'sell'),
+        'price': price.close.reindex(indc.index).to_numpy()[rows]
+    })
+    for column in columns:
+        signals[column] = indc[column].to_numpy()[rows]
+    return signals
+
+
+def trend_signals(price, indc):
+    buy, sell = trend_rule(indc.pb, indc.mfi)
+    return signal_frame(price, indc, buy, sell, ['pb', 'mfi'])
+
+
+def reversal_signals(price, indc):
+    buy, sell = reversal_rule(indc.pb, indc.iip)
+    return signal_frame(price, indc, buy, sell, ['pb', 'iip'])
+
+
+def triple_screen_signals(price, indc):
+    buy, sell = triple_screen_rule(indc.ema130, indc.ema130.shift(1), indc.pd, indc.pd.shift(1))
+    return signal_frame(price, indc, buy, sell, ['ema130', 'pd'])
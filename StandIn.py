@@ -0,0 +1,141 @@
+import os
+import threading
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+import pandas as pd
+
+
+# Page text in the siseJson format, built from daily (date, open, high, low, close, volume) rows
+def sise_payload(rows):
+    lines = ["[['날짜', '시가', '고가', '저가', '종가', '거래량', '외국인소진율']"]
+    for date, open_, high, low, close, volume in rows:
+        lines.append(f'["{date:%Y%m%d}", {open_}, {high}, {low}, {close}, {volume}, 0.0]')
+    return ',\n\t\t\n'.join(lines) + '\n\t\t\n]'
+
+
+# Random-walk daily prices (date, open, high, low, close, volume) of {n_days} business days ending at {end_date}
+def synthetic_ohlcv(n_days, end_date=None, seed=0):
+    rng = np.random.default_rng(seed)
+    if end_date is None:
+        end_date = datetime.today()
+    dates = pd.bdate_range(end=end_date.strftime('%Y-%m-%d'), periods=n_days)
+
+    close = np.maximum(100, (10000 * np.exp(np.cumsum(rng.normal(0, 0.02, n_days)))).astype(int))
+    open_ = np.maximum(100, (close * (1 + rng.normal(0, 0.01, n_days))).astype(int))
+    high = np.maximum(open_, close) + rng.integers(0, 200, n_days)
+    low = np.maximum(1, np.minimum(open_, close) - rng.integers(0, 200, n_days))
+    volume = rng.integers(1000, 1000000, n_days)
+    return pd.DataFrame({'date': dates, 'open': open_, 'high': high, 'low': low,
+                         'close': close, 'volume': volume})
+
+
+# Long-format prices (code, date, open, high, low, close, differ, volume) of {n_codes} synthetic stocks
+def synthetic_prices(n_codes, n_days, end_date=None, seed=0):
+    frames = []
+    for i in range(n_codes):
+        frame = synthetic_ohlcv(n_days, end_date, seed + i)
+        frame.insert(0, 'code', f'{i:06d}')
+        frame.insert(6, 'differ', frame.close.pct_change().fillna(0) * 100)
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+# Random-walk siseJson page of {n_days} business days ending at {end_date}
+def synthetic_sise_payload(n_days, end_date=None, seed=0):
+    ohlcv = synthetic_ohlcv(n_days, end_date, seed)
+    return sise_payload(ohlcv.itertuples(index=False))
+
+
+# Local stand-in for the siseJson endpoint, serving recorded responses.
+# responses: {code: page text} or a directory of {code}.json files.
+# fail_first: number of 503 answers per code before serving it (to exercise retries).
+class SiseStandInServer:
+
+    def __init__(self, responses, host='127.0.0.1', port=0, fail_first=0):
+        if isinstance(responses, str):
+            responses = self.load(responses)
+        self.responses = responses
+        self.fail_first = fail_first
+        self.failures = {}
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self.handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @staticmethod
+    def load(directory):
+        responses = {}
+        for file_name in os.listdir(directory):
+            code, ext = os.path.splitext(file_name)
+            if ext == '.json':
+                with open(os.path.join(directory, file_name), encoding='utf-8') as f:
+                    responses[code] = f.read()
+        return responses
+
+    # Save pages fetched from the real endpoint, to be served later
+    @staticmethod
+    def record(fetcher, codes, count, directory):
+        os.makedirs(directory, exist_ok=True)
+        for code, text, error in fetcher.fetch_many(codes, count):
+            if error is None:
+                with open(os.path.join(directory, f'{code}.json'), 'w', encoding='utf-8') as f:
+                    f.write(text)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/siseJson.nhn'
+
+    def handler(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive
+            disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query)
+                code = query.get('symbol', [''])[0]
+                with stand_in.lock:
+                    stand_in.requests += 1
+                    failed = stand_in.failures.get(code, 0)
+                    if failed < stand_in.fail_first:
+                        stand_in.failures[code] = failed + 1
+                        self.reply(503, '')
+                        return
+                text = stand_in.responses.get(code)
+                if text is None:
+                    self.reply(404, '')
+                else:
+                    self.reply(200, text)
+
+            def reply(self, status, text):
+                body = text.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/plain; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,193 @@
+import os
+import json
+import uuid
+import bisect
+import tempfile
+import threading
+from contextlib import closing
+from datetime import datetime
+import pandas as pd
+from DBWriter import param_mark
+
+# Snapshot of company_info shared by every process on the machine
+SNAPSHOT_PATH = os.path.join(tempfile.gettempdir(), 'finance_project_symbols.json')
+
+
+# Listed stocks with O(1) code <-> name lookup and prefix search.
+# symbol_meta holds the date company_info was last checked against KRX and a token that changes
+# whenever company_info changes; snapshots are valid while their token matches.
+class SymbolMaster:
+
+    def __init__(self, code_name=None, token=None):
+        self.code_name = dict(code_name or {})
+        self.token = token
+        self.index()
+
+    def index(self):
+        self.name_code = {name: code for code, name in self.code_name.items()}
+        self.sorted_codes = sorted(self.code_name)
+        self.sorted_names = sorted(self.name_code)
+
+    def __len__(self):
+        return len(self.code_name)
+
+    def __contains__(self, code):
+        return code in self.code_name
+
+    def code(self, name):
+        return self.name_code.get(name)
+
+    def name(self, code):
+        return self.code_name.get(code)
+
+    # Fill in whichever of code / name is None
+    def resolve(self, code=None, name=None):
+        if code is None:
+            code = self.name_code.get(name)
+        if name is None:
+            name = self.code_name[code]
+        return code, name
+
+    # (code, name) of stocks whose code or name starts with {prefix}, by code
+    def search(self, prefix, limit=None):
+        codes = set()
+        for keys, to_code in ((self.sorted_codes, lambda key: key), (self.sorted_names, self.name_code.get)):
+            i = bisect.bisect_left(keys, prefix)
+            while i < len(keys) and keys[i].startswith(prefix):
+                codes.add(to_code(keys[i]))
+                i += 1
+        found = [(code, self.code_name[code]) for code in sorted(codes)]
+        return found if limit is None else found[:limit]
+
+    # Changes from this master to {listing} (code, company): {'listed': {code: name},
+    # 'delisted': {code: name}, 'renamed': {code: (old name, new name)}}
+    def diff(self, listing):
+        new = dict(zip(listing.code, listing.company))
+        return {'listed': {code: name for code, name in new.items() if code not in self.code_name},
+                'delisted': {code: name for code, name in self.code_name.items() if code not in new},
+                'renamed': {code: (self.code_name[code], name) for code, name in new.items()
+                            if code in self.code_name and self.code_name[code] != name}}
+
+    # Bring company_info to {listing}, writing only listed, renamed and deleting delisted rows.
+    # Marks the check date, and changes the token when anything changed.
+    def refresh(self, connection, writer, listing, today=None):
+        today = today or datetime.today().strftime('%Y-%m-%d')
+        changes = self.diff(listing)
+        rows = [(code, name, today) for code, name in changes['listed'].items()] \
+            + [(code, new, today) for code, (old, new) in changes['renamed'].items()]
+        writer.upsert('company_info', rows, columns=('code', 'company', 'last_update'), keys=('code',))
+        writer.flush()
+        mark = param_mark(connection)
+        delisted = list(changes['delisted'])
+        with closing(connection.cursor()) as cursor:
+            for i in range(0, len(delisted), 500):
+                chunk = delisted[i:i + 500]
+                cursor.execute(f"DELETE FROM company_info WHERE code IN ({', '.join([mark] * len(chunk))})", chunk)
+            if rows or delisted:
+                self.token = uuid.uuid4().hex
+            cursor.execute(f"UPDATE symbol_meta SET checked = {mark}, token = {mark} WHERE id = 1",
+                           (today, self.token))
+        connection.commit()
+
+        for code in delisted:
+            del self.code_name[code]
+        self.code_name.update({code: name for code, name, _ in rows})
+        self.index()
+        return changes
+
+    # Date company_info was last checked against KRX, None before the first check
+    @staticmethod
+    def checked(connection):
+        with closing(connection.cursor()) as cursor:
+            cursor.execute("SELECT checked FROM symbol_meta WHERE id = 1")
+            row = cursor.fetchone()
+        return None if row is None or row[0] is None else str(row[0])
+
+    # Create symbol_meta, starting from the last company_info update of an existing DB
+    @staticmethod
+    def create_meta(connection):
+        with closing(connection.cursor()) as cursor:
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS symbol_meta (
+                id INT,
+                checked DATE,
+                token VARCHAR(32),
+                PRIMARY KEY (id)
+            );
+            """)
+            cursor.execute("SELECT COUNT(*) FROM symbol_meta")
+            if cursor.fetchone()[0] == 0:
+                cursor.execute("SELECT MAX(last_update) FROM company_info")
+                last_update = cursor.fetchone()[0]
+                mark = param_mark(connection)
+                cursor.execute(f"INSERT INTO symbol_meta (id, checked, token) VALUES (1, {mark}, {mark})",
+                               (None if last_update is None else str(last_update), uuid.uuid4().hex))
+        connection.commit()
+
+    # Read company_info from DB
+    @classmethod
+    def read(cls, connection):
+        with closing(connection.cursor()) as cursor:
+            cursor.execute("SELECT token FROM symbol_meta WHERE id = 1")
+            row = cursor.fetchone()
+        return cls(cls.read_company_info(connection), None if row is None else row[0])
+
+    # Symbol master of the DB behind {connection}: the one already loaded in this process or the
+    # {snapshot} file when their token is current, otherwise read from DB (and saved to the snapshot).
+    # Costs one small query when nothing changed.
+    @classmethod
+    def load(cls, connection, snapshot=SNAPSHOT_PATH):
+        try:
+            with closing(connection.cursor()) as cursor:
+                cursor.execute("SELECT token FROM symbol_meta WHERE id = 1")
+                row = cursor.fetchone()
+            token = None if row is None else row[0]
+        except Exception:  # DB not yet migrated by PriceUpdate
+            connection.rollback()
+            token = None
+        if token is None:
+            return cls(cls.read_company_info(connection))
+
+        with loaded_lock:
+            if token in loaded:
+                return loaded[token]
+        symbols = cls.read_snapshot(snapshot, token) if snapshot else None
+        if symbols is None:
+            symbols = cls.read(connection)
+            if snapshot:
+                symbols.write_snapshot(snapshot)
+        with loaded_lock:
+            loaded[token] = symbols
+        return symbols
+
+    @staticmethod
+    def read_company_info(connection):
+        with closing(connection.cursor()) as cursor:
+            cursor.execute("SELECT code, company FROM company_info")
+            return dict(cursor.fetchall())
+
+    @classmethod
+    def read_snapshot(cls, path, token):
+        try:
+            with open(path, encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if saved.get('token') != token:
+            return None
+        return cls(saved['symbols'], token)
+
+    # Write atomically, so readers in other processes never see a partial file
+    def write_snapshot(self, path):
+        directory = os.path.dirname(path) or '.'
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=directory, suffix='.tmp',
+                                         delete=False) as f:
+            json.dump({'token': self.token, 'symbols': self.code_name}, f, ensure_ascii=False)
+        os.replace(f.name, path)
+
+    def to_frame(self):
+        return pd.DataFrame(sorted(self.code_name.items()), columns=['code', 'company'])
+
+
+loaded = {}  # token -> SymbolMaster loaded in this process
+loaded_lock = threading.Lock()
@@ -0,0 +1,178 @@
+import bisect
+from datetime import datetime
+from contextlib import closing
+import pandas as pd
+from DBWriter import dialect, param_mark
+
+# Secondary index for cross-sectional reads of daily_price (every code on a date / date range)
+DATE_INDEX = 'daily_price_date'
+
+
+# Trading days of daily_price, with the number of codes priced on each.
+# Kept by PriceUpdate in the trading_calendar table, so the first / last trading day around a date
+# is found from a few hundred calendar rows instead of scanning daily_price.
+class TradingCalendar:
+
+    def __init__(self, dates=(), counts=None):
+        self.dates = [pd.Timestamp(date) for date in dates]
+        self.counts = dict(zip(self.dates, counts)) if counts is not None else {}
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __contains__(self, date):
+        date = pd.Timestamp(date)
+        i = bisect.bisect_left(self.dates, date)
+        return i < len(self.dates) and self.dates[i] == date
+
+    # First trading day on or after {date}, None if there is none
+    def on_or_after(self, date):
+        i = bisect.bisect_left(self.dates, pd.Timestamp(date))
+        return self.dates[i] if i < len(self.dates) else None
+
+    # Last trading day on or before {date}, None if there is none
+    def on_or_before(self, date):
+        i = bisect.bisect_right(self.dates, pd.Timestamp(date))
+        return self.dates[i - 1] if i else None
+
+    # Trading day {n} sessions after (n > 0) or before (n < 0) {date}; {date} itself need not be one
+    def shift(self, date, n):
+        date = pd.Timestamp(date)
+        if n >= 0:
+            i = bisect.bisect_right(self.dates, date) + n - 1
+        else:
+            i = bisect.bisect_left(self.dates, date) + n
+        return self.dates[i] if 0 <= i < len(self.dates) else None
+
+    # Trading days of [start_date, end_date]
+    def between(self, start_date=None, end_date=None):
+        start = 0 if start_date is None else bisect.bisect_left(self.dates, pd.Timestamp(start_date))
+        end = len(self.dates) if end_date is None else bisect.bisect_right(self.dates, pd.Timestamp(end_date))
+        return pd.DatetimeIndex(self.dates[start:end])
+
+    def last(self):
+        return self.dates[-1] if self.dates else None
+
+    # Calendar of the DB behind {connection}; built from daily_price when the table is not there yet
+    @classmethod
+    def load(cls, connection):
+        try:
+            with closing(connection.cursor()) as cursor:
+                cursor.execute("SELECT date, codes FROM trading_calendar ORDER BY date")
+                rows = cursor.fetchall()
+        except Exception:  # DB not yet migrated by PriceUpdate
+            connection.rollback()
+            with closing(connection.cursor()) as cursor:
+                cursor.execute("SELECT date, COUNT(*) FROM daily_price GROUP BY date ORDER BY date")
+                rows = cursor.fetchall()
+        return cls([date for date, _ in rows], [codes for _, codes in rows])
+
+    # Recount the codes priced on {dates} and write them, after their prices were written.
+    # One index range per date on (date, code).
+    @staticmethod
+    def update(connection, writer, dates, chunk_size=500):
+        dates = sorted({f'{pd.Timestamp(date):%Y-%m-%d}' for date in dates})
+        mark = param_mark(connection)
+        rows = []
+        with closing(connection.cursor()) as cursor:
+            for i in range(0, len(dates), chunk_size):
+                chunk = dates[i:i + chunk_size]
+                cursor.execute(f"SELECT date, COUNT(*) FROM daily_price "
+                               f"WHERE date IN ({', '.join([mark] * len(chunk))}) GROUP BY date", chunk)
+                rows.extend((str(date), count) for date, count in cursor.fetchall())
+        writer.upsert('trading_calendar', rows, columns=('date', 'codes'), keys=('date',))
+        writer.flush()
+        return len(rows)
+
+
+def has_index(connection, table, name):
+    with closing(connection.cursor()) as cursor:
+        if dialect(connection) == 'sqlite':
+            cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND name = ?",
+                           (table, name))
+        else:
+            cursor.execute("SELECT COUNT(*) FROM information_schema.statistics "
+                           "WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s",
+                           (table, name))
+        return cursor.fetchone()[0] > 0
+
+
+# Create trading_calendar and the (date, code) index of daily_price if missing.
+# Migration of an existing DB: building the index and the first calendar read all of daily_price once.
+def create_schema(connection):
+    with closing(connection.cursor()) as cursor:
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS trading_calendar (
+            date DATE,
+            codes INT,
+            PRIMARY KEY (date)
+        );
+        """)
+        # MySQL has no CREATE INDEX IF NOT EXISTS
+        if not has_index(connection, 'daily_price', DATE_INDEX):
+            print(f'Creating index {DATE_INDEX} on daily_price (date, code)...')
+            cursor.execute(f"CREATE INDEX {DATE_INDEX} ON daily_price (date, code)")
+        cursor.execute("SELECT COUNT(*) FROM trading_calendar")
+        if cursor.fetchone()[0] == 0:
+            cursor.execute("""
+            INSERT INTO trading_calendar (date, codes)
+            SELECT date, COUNT(*) FROM daily_price GROUP BY date
+            """)
+    connection.commit()
+
+
+# Yearly partitions of daily_price, {year: partition name}; empty when not partitioned
+def partitions(connection):
+    if dialect(connection) == 'sqlite':
+        return {}
+    with closing(connection.cursor()) as cursor:
+        cursor.execute("SELECT partition_name FROM information_schema.partitions "
+                       "WHERE table_schema = DATABASE() AND table_name = 'daily_price' "
+                       "AND partition_name IS NOT NULL")
+        names = [name for name, in cursor.fetchall()]
+    return {int(name[1:]): name for name in names if name[1:].isdigit()}
+
+
+def partition_sql(years):
+    return ', '.join([f"PARTITION p{year} VALUES LESS THAN ('{year + 1}-01-01')" for year in years]
+                     + ["PARTITION pmax VALUES LESS THAN (MAXVALUE)"])
+
+
+# Partition daily_price by year of date (MySQL only), through {end_year} (default: next year).
+# The first run rebuilds the table; later runs split new years off the pmax partition.
+# Date-range queries then only read the partitions of their years.
+def partition_daily_price(connection, start_year=None, end_year=None):
+    if dialect(connection) != 'mysql':
+        raise ValueError('Partitioning needs a MySQL connection')
+    end_year = end_year or datetime.today().year + 1
+    existing = partitions(connection)
+    with closing(connection.cursor()) as cursor:
+        if not existing:
+            if start_year is None:
+                cursor.execute("SELECT MIN(date) FROM daily_price")
+                first = cursor.fetchone()[0]
+                start_year = first.year if first is not None else datetime.today().year
+            years = range(start_year, end_year + 1)
+            print(f'Partitioning daily_price by year ({start_year}-{end_year})...')
+            cursor.execute(f"ALTER TABLE daily_price PARTITION BY RANGE COLUMNS(date) ({partition_sql(years)})")
+        else:
+            years = range(max(existing) + 1, end_year + 1)
+            if years:
+                cursor.execute(f"ALTER TABLE daily_price REORGANIZE PARTITION pmax INTO ({partition_sql(years)})")
+    connection.commit()
+    return len(years)
+
+
+# Migrate an existing DB: python TradingCalendar.py [--partition]
+if __name__ == '__main__':
+    import argparse
+    import getpass
+    from DBPool import get_pool
+    parser = argparse.ArgumentParser(description='Add trading_calendar and daily_price date index')
+    parser.add_argument('--partition', action='store_true', help='also partition daily_price by year')
+    args = parser.parse_args()
+    with get_pool(getpass.getpass('DB password: ')).connection() as connection:
+        create_schema(connection)
+        if args.partition:
+            partition_daily_price(connection)
+        print(f'trading_calendar: {len(TradingCalendar.load(connection))} trading days')
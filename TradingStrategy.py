@@ -1,246 +1,269 @@
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-from matplotlib import gridspec, rc, rcParams
-import seaborn as sns
-from scipy.optimize import minimize
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
-import pymysql
 from PriceDB import PriceCheck
-from ChartTool import x_axis_setting, price_bar
+from DBWriter import param_mark
+from Signal import bollinger_indicators, triple_screen_indicators, \
+    trend_signals, reversal_signals, triple_screen_signals
+
+# matplotlib, seaborn (plotting) and scipy (optimization) are imported by the functions using them,
+# so signals and backtests load without them
+# db_pw of every strategy: DB password, or a DBPool.ConnectionPool to share connections
 
 
 # Bollinger Band
 class BollingerBand:
-    def __init__(self, db_pw, code=None, name=None, start_date=None, end_date=None):   
-        pc = PriceCheck(db_pw)
-        if code is None:
-            for stockcode, stockname in pc.code_name_match.items():
-                if stockname == name:
-                    code = stockcode
-        if name == None:
-            name = pc.code_name_match[code]
+    def __init__(self, db_pw, code=None, name=None, start_date=None, end_date=None, cache=None):
+        pc = PriceCheck(db_pw, cache)
+        code, name = pc.symbols.resolve(code, name)
         self.code = code
         self.name = name
 
-        price = pc.get_price(code, name, start_date, end_date)
-        indc = pd.DataFrame()  # indicator dataframe
-        
-        # Calcluate Bollinger Band
-        indc['ma'] = price.close.rolling(window=20, min_periods=1).mean()  # 20-day moving average
-        indc['stdev'] = price.close.rolling(window=20, min_periods=1).std()  # 20-day std
-        indc['upperbb'] = indc.ma + 2 * indc.stdev
-        indc['lowerbb'] = indc.ma - 2 * indc.stdev
-
-        # %B indicator
-        indc['pb'] = (price.close - indc.lowerbb) / (indc.upperbb - indc.lowerbb)
-
-        # Calculate MFI(Money Flow Index)
-        indc['tp'] = (price.low + price.close + price.high) / 3  # typical price
-        indc['pmf'] = indc.tp * price.volume  # positive money flow
-        indc['nmf'] = indc.tp * price.volume  # negative money flow
-
-        for index in range(1, len(indc)):
-            if indc.tp.iloc[index] > indc.tp.iloc[index-1]:
-                indc.nmf.iloc[index] = 0
-            else:
-                indc.pmf.iloc[index] = 0
-        
-        indc['mfi'] = 100 - 100 / (1 + indc.pmf.rolling(window=10, min_periods=1).sum()
-            / indc.nmf.rolling(window=10, min_periods=1).sum())
-        
-        # Calculate II(Intraday Intensity), II%
-        indc['ii'] = (2 * price.close - price.high - price.low) \
-            / (price.high - price.low) * price.volume
-        indc['iip'] = indc.ii.rolling(window=21, min_periods=1).sum() \
-            / price.volume.rolling(window=21, min_periods=1).sum() * 100
+        self.set_price(pc.get_price(code, name, start_date, end_date, compact=True))
 
-        self.indc = indc.dropna()
+    # Build from an already loaded price frame, without DB access
+    @classmethod
+    def from_price(cls, price, code=None, name=None):
+        bb = cls.__new__(cls)
+        bb.code = code
+        bb.name = name
+        bb.set_price(price)
+        return bb
+
+    def set_price(self, price):
+        self.indc = bollinger_indicators(price).dropna()
         self.price = price.iloc[-len(self.indc):]
-        
-        plt.style.use('seaborn-darkgrid')
+
+    # noinspection PyMethodMayBeStatic
+    def plot_style(self):
+        import matplotlib.pyplot as plt
+        from matplotlib import rc, rcParams
+        from ChartTool import DARKGRID
+        plt.style.use(DARKGRID)
         try:
             rc('font', family='NanumGothic')
             rcParams['axes.unicode_minus'] = False
         except FileNotFoundError:
             print("You should install 'NanumGothic' font.")
 
-    # Trend Trading Strategy
-    def trend(self):
+    # Trend Trading signals: date, side, price, %B, MFI
+    def trend_signals(self):
+        return trend_signals(self.price, self.indc)
+
+    # Reversal Trading signals: date, side, price, %B, II%
+    def reversal_signals(self):
+        return reversal_signals(self.price, self.indc)
+
+    # Close price with BB and buy / sell signals
+    def draw_band(self, ax, signals):
         price = self.price
         indc = self.indc
-
-        plt.figure(figsize=(12, 6))
-        plt.suptitle(f"Trend Trading: Chart of {self.name}({self.code}) with Bollinger Band, 20 days, 2 std",
-                     position=(0.5, 0.93), fontsize=15)
+        ax.plot(price.index, price.close, c='k', linestyle='-', label='Close')
+        ax.plot(indc.index, indc.ma, c='0.4', linestyle='-', label='MA20')
+        ax.plot(indc.index, indc.upperbb, c='salmon', linestyle='--', label='UpperBB')
+        ax.plot(indc.index, indc.lowerbb, c='teal', linestyle='--', label='LowerBB')
+        ax.fill_between(indc.index, indc.upperbb, indc.lowerbb, color='0.8')
+
+        buy = signals[signals.side == 'buy']
+        sell = signals[signals.side == 'sell']
+        ax.plot(buy.date, buy.price, 'r^')
+        ax.plot(sell.date, sell.price, 'bv')
+
+    # Draw the Trend Trading chart on {figure}
+    def draw_trend(self, figure):
+        indc = self.indc
+        figure.suptitle(f"Trend Trading: Chart of {self.name}({self.code}) with Bollinger Band, 20 days, 2 std",
+                        position=(0.5, 0.93), fontsize=15)
 
         # Upper chart: chart with BB
-        plt.subplot(211)
-        plt.plot(price.index, price.close, c='k', linestyle='-', label='Close')
-        plt.plot(indc.index, indc.ma, c='0.4', linestyle='-', label='MA20')
-        plt.plot(indc.index, indc.upperbb, c='salmon', linestyle='--', label='UpperBB')
-        plt.plot(indc.index, indc.lowerbb, c='teal', linestyle='--', label='LowerBB')
-        plt.fill_between(indc.index, indc.upperbb, indc.lowerbb, color='0.8')
-        
-        for index in indc.index:
-            if indc.pb.loc[index] > 0.8 and indc.mfi.loc[index] > 80:
-                # buy
-                plt.plot(index, price.close.loc[index], 'r^')
-            elif indc.pb.loc[index] < 0.2 and indc.mfi.loc[index] < 20:
-                # sell
-                plt.plot(index, price.close.loc[index], 'bv')
+        self.draw_band(figure.add_subplot(211), self.trend_signals())
 
         # Lower chart: %B, MFI
-        lower_chart = plt.subplot(212)
-        ax1 = plt.subplot(lower_chart)
+        ax1 = figure.add_subplot(212)
         pb_plot = ax1.plot(indc.index, indc.pb, c='darkcyan', linestyle='-', linewidth=1, label='%B')
         ax1.set_ylim(-0.4, 1.4)
-        plt.ylabel('%B')
-        plt.axhline(y=0.8, color='0.5', linestyle='--', linewidth=1)
-        plt.axhline(y=0.2, color='0.5', linestyle='--', linewidth=1)
+        ax1.set_ylabel('%B')
+        ax1.axhline(y=0.8, color='0.5', linestyle='--', linewidth=1)
+        ax1.axhline(y=0.2, color='0.5', linestyle='--', linewidth=1)
 
         ax2 = ax1.twinx()
         mfi_plot = ax2.plot(indc.index, indc.mfi, c='chocolate', linestyle='-', linewidth=1, label='MFI')
         ax2.set_ylim(-40, 140)
-        plt.ylabel('MFI', rotation=270)
+        ax2.set_ylabel('MFI', rotation=270)
 
         plots = pb_plot + mfi_plot
         labels = [plot.get_label() for plot in plots]
-        lower_chart.legend(plots, labels)
+        ax1.legend(plots, labels)
 
-        plt.show()
-
-    # Reversal Trading Strategy
-    def reversal(self):
-        price = self.price
+    # Draw the Reversal Trading chart on {figure}
+    def draw_reversal(self, figure):
         indc = self.indc
-
-        plt.figure(figsize=(12, 8))
-        plt.suptitle(f"Reversal Trading: Chart of {self.name}({self.code}) with Bollinger Band, 20 days, 2 std",
-                     position=(0.5, 0.93), fontsize=15)
+        figure.suptitle(f"Reversal Trading: Chart of {self.name}({self.code}) with Bollinger Band, 20 days, 2 std",
+                        position=(0.5, 0.93), fontsize=15)
 
         # Upper chart: chart with BB
-        plt.subplot(311)
-        plt.plot(price.index, price.close, c='k', linestyle='-', label='Close')
-        plt.plot(indc.index, indc.ma, c='0.4', linestyle='-', label='MA20')
-        plt.plot(indc.index, indc.upperbb, c='salmon', linestyle='--', label='UpperBB')
-        plt.plot(indc.index, indc.lowerbb, c='teal', linestyle='--', label='LowerBB')
-        plt.fill_between(indc.index, indc.upperbb, indc.lowerbb, color='0.8')
-        
-        for index in indc.index:
-            if indc.pb.loc[index] < 0.05 and indc.iip.loc[index] > 0:
-                # buy
-                plt.plot(index, price.close.loc[index], 'r^')
-            elif indc.pb.loc[index] > 0.95 and indc.iip.loc[index] < 0:
-                # sell
-                plt.plot(index, price.close.loc[index], 'bv')
+        self.draw_band(figure.add_subplot(311), self.reversal_signals())
 
         # Middle chart: %B
-        plt.subplot(312)
-        plt.plot(indc.index, indc.pb, c='darkcyan', linestyle='-', linewidth=1, label='%B')
-        plt.axis([None, None, -0.4, 1.4])
-        plt.ylabel('%B')
-        plt.axhline(y=0.95, color='0.5', linestyle='--', linewidth=1)
-        plt.axhline(y=0.05, color='0.5', linestyle='--', linewidth=1)
-        plt.legend()
+        ax = figure.add_subplot(312)
+        ax.plot(indc.index, indc.pb, c='darkcyan', linestyle='-', linewidth=1, label='%B')
+        ax.set_ylim(-0.4, 1.4)
+        ax.set_ylabel('%B')
+        ax.axhline(y=0.95, color='0.5', linestyle='--', linewidth=1)
+        ax.axhline(y=0.05, color='0.5', linestyle='--', linewidth=1)
+        ax.legend()
 
         # Lower chart: II%
-        plt.subplot(313)
-        plt.plot(indc.index, indc.iip, c='chocolate', linestyle='-', linewidth=1, label='II%')
-        plt.axis([None, None, -50, 50])
-        plt.ylabel('II%')
-        plt.axhline(y=0, color='0.5', linestyle='--', linewidth=1)
-        plt.legend()
+        ax = figure.add_subplot(313)
+        ax.plot(indc.index, indc.iip, c='chocolate', linestyle='-', linewidth=1, label='II%')
+        ax.set_ylim(-50, 50)
+        ax.set_ylabel('II%')
+        ax.axhline(y=0, color='0.5', linestyle='--', linewidth=1)
+        ax.legend()
 
+    # Trend Trading Strategy
+    def trend(self):
+        import matplotlib.pyplot as plt
+        self.plot_style()
+        self.draw_trend(plt.figure(figsize=(12, 6)))
+        plt.show()
+
+    # Reversal Trading Strategy
+    def reversal(self):
+        import matplotlib.pyplot as plt
+        self.plot_style()
+        self.draw_reversal(plt.figure(figsize=(12, 8)))
         plt.show()
 
 
 # Triple Screen Trading
-def TripleScreen(db_pw, code=None, name=None, start_date=None, end_date=None):
-    pc = PriceCheck(db_pw)
-    if code is None:
-        for stockcode, stockname in pc.code_name_match.items():
-            if stockname == name:
-                code = stockcode
-    if name == None:
-        name = pc.code_name_match[code]
-
-    plt.style.use('seaborn-darkgrid')
-    rc('font', family='NanumGothic')
-    rcParams['axes.unicode_minus'] = False
+# Return (code, name, price, indicator dataframe) of the stock
+def triple_screen_data(db_pw, code=None, name=None, start_date=None, end_date=None, cache=None):
+    pc = PriceCheck(db_pw, cache)
+    code, name = pc.symbols.resolve(code, name)
+
+    price = pc.get_price(code, name, start_date, end_date, compact=True)
+    return code, name, price, triple_screen_indicators(price)
+
 
-    price = pc.get_price(code, name, start_date, end_date)
-    indc = pd.DataFrame()  # indicator dataframe
-
-    # macd
-    indc['ema60'] = price.close.ewm(span=60).mean()  # exponential moving average, 12 weeks
-    indc['ema130'] = price.close.ewm(span=130).mean()  # exponential moving average, 26 weeks
-    indc['macd'] = indc.ema60 - indc.ema130  # moving average convergence divergence
-    indc['signal'] = indc.macd.ewm(span=45).mean()
-    indc['macd_hist'] = indc.macd - indc.signal
-
-    # stochastic
-    highest = price.high.rolling(window=14, min_periods=1).max()
-    lowest = price.low.rolling(window=14, min_periods=1).min()
-    indc['pk'] = (price.close - lowest) / (highest - lowest) * 100  # %K
-    indc['pd'] = indc.pk.rolling(window=3, min_periods=1).mean()
-    
-    # Plotting
-    plt.figure(figsize=(14, 7))
-    plt.suptitle(f"Triple Screen Trading: {name}({code})", position=(0.5, 0.93), fontsize=15)
+# Triple Screen Trading signals: date, side, price, EMA130, %D
+def TripleScreenSignals(db_pw, code=None, name=None, start_date=None, end_date=None, cache=None):
+    code, name, price, indc = triple_screen_data(db_pw, code, name, start_date, end_date, cache)
+    return triple_screen_signals(price, indc)
+
+
+# Draw the Triple Screen Trading chart on {figure}
+def draw_triple_screen(figure, code, name, price, indc):
+    from ChartTool import x_axis_setting, price_bar, bar_collection
+    from PriceFrame import price_dates
+    figure.suptitle(f"Triple Screen Trading: {name}({code})", position=(0.5, 0.93), fontsize=15)
 
     # First Screen
-    first_screen = plt.subplot(311)
-    first_screen.grid(True)
-    ax = plt.subplot(first_screen)
+    ax = figure.add_subplot(311)
+    ax.grid(True)
     price_bar(ax, price, up='r', down='b', show_labels=False)
-    plt.plot(range(len(indc)), indc.ema130, c='darkcyan', label='EMA130')
-    plt.legend()
+    ax.plot(range(len(indc)), indc.ema130, c='darkcyan', label='EMA130')
+    ax.legend()
 
     # Buy / Sell
-    for i in range(len(price)):
-        if indc.ema130.iloc[i] < indc.ema130.iloc[i-1] and \
-            indc.pd.iloc[i-1] >= 20 and indc.pd.iloc[i] < 20:
-            plt.plot(i, price.close.iloc[i], c='maroon', marker='^')
-        elif indc.ema130.iloc[i] > indc.ema130.iloc[i-1] and \
-            indc.pd.iloc[i-1] <= 80 and indc.pd.iloc[i] > 80:
-            plt.plot(i, price.close.iloc[i], c='navy', marker='v')
+    signals = triple_screen_signals(price, indc)
+    buy = signals[signals.side == 'buy']
+    sell = signals[signals.side == 'sell']
+    ax.plot(price.index.get_indexer(buy.date), buy.price, c='maroon', marker='^', linestyle='none')
+    ax.plot(price.index.get_indexer(sell.date), sell.price, c='navy', marker='v', linestyle='none')
 
     # Second Screen
-    second_screen = plt.subplot(312)
-    plt.plot(range(len(indc)), indc.macd, c='coral', label='MACD')
-    plt.plot(range(len(indc)), indc.signal, c='steelblue', label='MACD Signal')
-    plt.bar(range(len(indc)), indc.macd_hist, color='indigo', label='MACD Hist')
-    x_axis_setting(price.date, True, False)
-    plt.legend()
+    ax = figure.add_subplot(312)
+    ax.plot(range(len(indc)), indc.macd, c='coral', label='MACD')
+    ax.plot(range(len(indc)), indc.signal, c='steelblue', label='MACD Signal')
+    bar_collection(ax, indc.macd_hist, color='indigo', label='MACD Hist')
+    x_axis_setting(price_dates(price), True, False, ax)
+    ax.legend()
 
     # Third Screen
-    third_screen = plt.subplot(313)
-    plt.plot(range(len(indc)), indc.pk, c='olive', label='%K')
-    plt.plot(range(len(indc)), indc.pd, c='k', label='%D')
-    plt.axhline(y=20, color='0.5', linestyle='--', linewidth=1)
-    plt.axhline(y=80, color='0.5', linestyle='--', linewidth=1)
-    x_axis_setting(price.date, True, True)
-    plt.legend()
+    ax = figure.add_subplot(313)
+    ax.plot(range(len(indc)), indc.pk, c='olive', label='%K')
+    ax.plot(range(len(indc)), indc.pd, c='k', label='%D')
+    ax.axhline(y=20, color='0.5', linestyle='--', linewidth=1)
+    ax.axhline(y=80, color='0.5', linestyle='--', linewidth=1)
+    x_axis_setting(price_dates(price), True, True, ax)
+    ax.legend()
+
+
+def TripleScreen(db_pw, code=None, name=None, start_date=None, end_date=None, cache=None):
+    import matplotlib.pyplot as plt
+    from matplotlib import rc, rcParams
+    from ChartTool import DARKGRID
+    code, name, price, indc = triple_screen_data(db_pw, code, name, start_date, end_date, cache)
+
+    plt.style.use(DARKGRID)
+    rc('font', family='NanumGothic')
+    rcParams['axes.unicode_minus'] = False
 
+    draw_triple_screen(plt.figure(figsize=(14, 7)), code, name, price, indc)
     plt.show()
 
 
+# Long-only minimum variance weights, for {target_return} or the global minimum when None.
+# SLSQP with the analytic gradient of the variance and of the constraints.
+def min_variance_weights(annual_return, annual_cov, target_return=None, init_weights=None):
+    from scipy.optimize import minimize
+    number = len(annual_return)
+    if init_weights is None:
+        init_weights = np.full(number, 1 / number)
+    constraints = [{'type': 'eq', 'fun': lambda w: w.sum() - 1, 'jac': lambda w: np.ones(number)}]
+    if target_return is not None:
+        constraints.append({'type': 'eq', 'fun': lambda w: w @ annual_return - target_return,
+                            'jac': lambda w: annual_return})
+    opt = minimize(lambda w: w @ annual_cov @ w, init_weights, jac=lambda w: 2 * annual_cov @ w,
+                   method='SLSQP', bounds=[(0, 1)] * number, constraints=constraints)
+    weights = np.clip(opt.x, 0, 1)
+    return weights / weights.sum()
+
+
+# Long-only maximum Sharpe weights: minimize y'Cy subject to return'y = 1, y >= 0, then w = y / sum(y).
+# Without any positive expected return, the stock with the highest return.
+def max_sharpe_weights(annual_return, annual_cov):
+    from scipy.optimize import minimize
+    number = len(annual_return)
+    best = np.argmax(annual_return)
+    if annual_return[best] <= 0:
+        return np.eye(number)[best]
+    init_y = np.eye(number)[best] / annual_return[best]
+    opt = minimize(lambda y: y @ annual_cov @ y, init_y, jac=lambda y: 2 * annual_cov @ y, method='SLSQP',
+                   bounds=[(0, None)] * number,
+                   constraints=[{'type': 'eq', 'fun': lambda y: y @ annual_return - 1,
+                                 'jac': lambda y: annual_return}])
+    y = np.clip(opt.x, 0, None)
+    return y / y.sum()
+
+
+# Minimum variance weights along {targets}, each warm-started from the previous point
+def frontier_weights(annual_return, annual_cov, targets):
+    weights = []
+    init_weights = None
+    for target in targets:
+        init_weights = min_variance_weights(annual_return, annual_cov, target, init_weights)
+        weights.append(init_weights)
+    return weights
+
+
 # Modern Portfolio Theory
 class ModernPortfolio:
-    def __init__(self, db_pw, codes=None, names=None, start_date=None, end_date=None):
-        np.random.seed(0)
-        pc = PriceCheck(db_pw)
+    # samples: number of random portfolios, drawn {chunk_size} at a time with {seed}
+    # keep_weights: store the (samples x stocks) weight matrix in self.weights
+    def __init__(self, db_pw, codes=None, names=None, start_date=None, end_date=None, cache=None,
+                 samples=10000, seed=0, chunk_size=100000, keep_weights=True):
+        pc = PriceCheck(db_pw, cache)
         code_name_match = pc.code_name_match
         if names == None:
             names = [code_name_match[code] for code in codes]
 
         self.names = names
 
-        close_df = pd.DataFrame()
-        for stock_name in names:
-            close_df[stock_name] = pc.get_price(name=stock_name, start_date=start_date, end_date=end_date).close
+        close_df = pc.get_prices(names=names, start_date=start_date, end_date=end_date,
+                                 field='close', columns='name')
         self.close_df = close_df
 
         # Assume annual trading days are 250 days
@@ -250,59 +273,72 @@ class ModernPortfolio:
         self.annual_return = annual_return
         self.annual_cov = annual_cov
 
-        # Portfolios made randomly
-        portfolios_list = []
-
-        for index in range(10000):
-            weights = np.random.random(len(self.names))
-            weights = weights / sum(weights)
-            return_ = np.dot(weights, annual_return)
-            risk_ = np.sqrt(np.dot(weights.T, np.dot(annual_cov, weights)))
-            # Assume risk free interest rate = 0
-            Sharpe = return_ / risk_
-            temp_df = pd.DataFrame([[return_, risk_, weights, Sharpe]],
-                                columns=['return_', 'risk_', 'weights', 'Sharpe'])
-            portfolios_list.append(temp_df)
-
-        portfolios = pd.concat(portfolios_list, ignore_index=True)
-        self.portfolios = portfolios
-
-
-    def efficient_frontier(self):
-        annual_return = self.annual_return
-        annual_cov = self.annual_cov
+        self.portfolios, self.weights = self.random_portfolios(samples, seed, chunk_size, keep_weights)
+
+    # Portfolios made randomly: DataFrame of return_, risk_, Sharpe and the weight matrix (or None)
+    def random_portfolios(self, samples, seed=0, chunk_size=100000, keep_weights=True):
+        random_state = np.random.RandomState(seed)
+        annual_return = self.annual_return.to_numpy()
+        annual_cov = self.annual_cov.to_numpy()
+        number = len(annual_return)
+
+        return_ = np.empty(samples)
+        risk_ = np.empty(samples)
+        all_weights = np.empty((samples, number)) if keep_weights else None
+
+        for start in range(0, samples, chunk_size):
+            end = min(start + chunk_size, samples)
+            weights = random_state.random_sample((end - start, number))
+            weights /= weights.sum(axis=1, keepdims=True)
+            return_[start:end] = weights @ annual_return
+            risk_[start:end] = np.sqrt(np.einsum('ij,jk,ik->i', weights, annual_cov, weights))
+            if keep_weights:
+                all_weights[start:end] = weights
+
+        # Assume risk free interest rate = 0
+        portfolios = pd.DataFrame({'return_': return_, 'risk_': risk_, 'Sharpe': return_ / risk_})
+        return portfolios, all_weights
+
+    # Row of return_, risk_, Sharpe and the weight of each stock
+    def portfolio(self, weights):
+        return_ = float(weights @ self.annual_return.to_numpy())
+        risk_ = float(np.sqrt(weights @ self.annual_cov.to_numpy() @ weights))
+        return pd.Series([return_, risk_, return_ / risk_] + list(weights),
+                         index=['return_', 'risk_', 'Sharpe'] + list(self.names))
+
+    # Global minimum variance portfolio
+    def min_variance(self):
+        return self.portfolio(min_variance_weights(self.annual_return.to_numpy(), self.annual_cov.to_numpy()))
+
+    # Maximum Sharpe ratio portfolio (risk free interest rate = 0)
+    def max_sharpe(self):
+        return self.portfolio(max_sharpe_weights(self.annual_return.to_numpy(), self.annual_cov.to_numpy()))
+
+    # Minimum variance portfolios for {points} target returns between the lowest and highest
+    # return of the random portfolios: return_, risk_, Sharpe and one weight column per stock.
+    # Each point starts from its neighbour's solution; workers > 1 solves contiguous segments in parallel.
+    def efficient_frontier(self, points=100, workers=None):
+        annual_return = self.annual_return.to_numpy()
+        annual_cov = self.annual_cov.to_numpy()
         portfolios = self.portfolios
 
-        return_range = np.linspace(min(portfolios.return_), max(portfolios.return_), 100)
-        efficient_list = []
-
-        def neg_sharpe(weights):
-            weights_return_ = np.dot(weights, annual_return)
-            weights_risk_ = np.sqrt(np.dot(weights.T, np.dot(annual_cov, weights)))
-            return - abs(weights_return_) / weights_risk_
-
-        def sum_is_one(weights):
-            return sum(weights) - 1
-
-        number = len(portfolios.loc[0].weights)
-        init_weights = np.array([1 / number]) * number
-        bounds = [[0, 1]] * number
+        return_range = np.linspace(min(portfolios.return_), max(portfolios.return_), points)
 
         # 각 return 값들에 대해 minimize risk
-        for opt_return_ in return_range:
-            def return_constraint(weights):
-                return np.dot(weights, annual_return) - opt_return_
-            constraints = [{'type': 'eq', 'fun': sum_is_one},
-                        {'type': 'eq', 'fun': return_constraint}]
-            opt = minimize(neg_sharpe, init_weights, method='SLSQP', bounds=bounds, constraints=constraints)
-            opt_weights = opt.x
-            opt_risk_ = np.sqrt(np.dot(opt_weights.T, np.dot(annual_cov, opt_weights)))
-            temp_df = pd.DataFrame([[opt_return_, opt_risk_, opt_weights, -opt.fun]],
-                                columns=['return_', 'risk_', 'weights', 'Sharpe'])
-            efficient_list.append(temp_df)
-        return pd.concat(efficient_list, ignore_index=True)
-    
+        if workers is None or workers <= 1:
+            weights = frontier_weights(annual_return, annual_cov, return_range)
+        else:
+            segments = np.array_split(return_range, workers)
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = executor.map(frontier_weights, [annual_return] * workers, [annual_cov] * workers,
+                                       segments)
+                weights = [w for segment_weights in results for w in segment_weights]
+        return pd.DataFrame([self.portfolio(w) for w in weights], index=range(len(weights)))
+
     def efficient_frontier_plot(self):
+        import matplotlib.pyplot as plt
+        from matplotlib import rc, rcParams
+        import seaborn as sns
         portfolios = self.portfolios
         efficient_frontier = self.efficient_frontier()
 
@@ -323,7 +359,7 @@ class ModernPortfolio:
 
         plt.scatter(lowest_risk_, return_at_lowest_risk_, c='r', s=50, zorder=10)
 
-        for i, weight in enumerate(efficient_frontier.weights):
+        for i, weight in enumerate(efficient_frontier[self.names].to_numpy()):
             if i % 10 == lowest_risk_index % 10 and i >= lowest_risk_index:
                 plt.annotate([int(100 * r) for r in weight], \
                     (efficient_frontier.risk_[i], efficient_frontier.return_[i]),
@@ -337,87 +373,100 @@ class ModernPortfolio:
 
 # Dual Momentum
 class DualMomentum:
-    def __init__(self, db_pw):
+    def __init__(self, db_pw, cache=None):
         self.db_pw = db_pw
-        pc = PriceCheck(db_pw)
-        self.code_name_match = pc.code_name_match
-        
-    def rel_momentum(self, start_date, end_date, number):
-        connection = pymysql.connect(
-            host='localhost', user='root', db='trading_db', password=self.db_pw, charset='utf8')
-        cursor = connection.cursor()
+        self.pc = PriceCheck(db_pw, cache)
+        self.code_name_match = self.pc.code_name_match
 
+    # Return of every stock in {codes} (all when None) between the trading days nearest to
+    # start_date (on or after) and end_date (on or before), with one query
+    def period_returns(self, start_date, end_date, codes=None):
         # Need exact prices at start & end
         # Therefore find exact start & end date
-        cursor.execute(f"SELECT MIN(date) FROM daily_price WHERE date >= '{start_date}'")
-        start_date = cursor.fetchone()[0].strftime('%Y-%m-%d')
-        cursor.execute(f"SELECT MAX(date) FROM daily_price WHERE date <= '{end_date}'")
-        end_date = cursor.fetchone()[0].strftime('%Y-%m-%d')
+        calendar = self.pc.get_calendar()
+        start_date = calendar.on_or_after(start_date)
+        end_date = calendar.on_or_before(end_date)
+        if start_date is None or end_date is None:
+            raise ValueError('No trading day in the period')
+
+        with self.pc.pool.connection() as connection:
+            mark = param_mark(connection)
+            sql = f"SELECT code, date, close FROM daily_price WHERE date IN ({mark}, {mark})"
+            params = [f'{start_date:%Y-%m-%d}', f'{end_date:%Y-%m-%d}']
+            if codes is not None:
+                codes = list(codes)
+                sql += f" and code IN ({', '.join([mark] * len(codes))})"
+                params += codes
+            closes = pd.read_sql(sql, connection, params=params)
+        closes['date'] = pd.to_datetime(closes.date)
+        closes = closes.pivot(index='code', columns='date', values='close')
+        closes = closes.reindex(columns=pd.DatetimeIndex([start_date, end_date]))
+
+        return_df = pd.DataFrame({'start_close': closes.iloc[:, 0], 'end_close': closes.iloc[:, -1]}).dropna()
+        return_df['return_'] = (return_df.end_close / return_df.start_close - 1) * 100
+        return_df = return_df.rename_axis('code').reset_index()
+        return_df.insert(1, 'name', return_df.code.map(self.code_name_match))
+        return return_df
 
+    def rel_momentum(self, start_date, end_date, number):
         # Relative Strength
-        return_list = []
-        cursor = connection.cursor()
-        for code in self.code_name_match.keys():
-            name = self.code_name_match[code]
-            cursor.execute(
-                f"SELECT close FROM daily_price WHERE code='{code}' and date='{start_date}'")
-            try:
-                fetch = cursor.fetchone()[0]
-                start_close = fetch
-            except:
-                continue
-
-            cursor.execute(
-                f"SELECT close FROM daily_price WHERE code='{code}' and date='{end_date}'")
-            try:
-                fetch = cursor.fetchone()[0]
-                end_close = fetch
-            except:
-                continue
-
-            temp_row = [code, name, start_close, end_close, (end_close / start_close - 1) * 100]
-            temp_df = pd.DataFrame([temp_row], columns=['code', 'name', 'start_close', 'end_close', 'return_'])
-            return_list.append(temp_df)
-        
-        return_df = pd.concat(return_list).sort_values(by='return_', ascending=False).reset_index(drop=True)
-        return return_df.head(number)
-        connection.close()
+        return_df = self.period_returns(start_date, end_date)
+        return_df = return_df[return_df.code.isin(self.code_name_match.keys())]
+        return_df = return_df.nlargest(number, 'return_').reset_index(drop=True)
+        return return_df
 
     def abs_momentum(self, rel_momentum, start_date, end_date):
-        connection = pymysql.connect(
-            host='localhost', user='root', db='trading_db', password=self.db_pw, charset='utf8')
-        cursor = connection.cursor()
-
-        # Need exact prices at start & end
-        # Therefore find exact start & end date
-        cursor.execute(f"SELECT MIN(date) FROM daily_price WHERE date >= '{start_date}'")
-        start_date = cursor.fetchone()[0].strftime('%Y-%m-%d')
-        cursor.execute(f"SELECT MAX(date) FROM daily_price WHERE date <= '{end_date}'")
-        end_date = cursor.fetchone()[0].strftime('%Y-%m-%d')
-
-        return_list = []
-        cursor = connection.cursor()
-        for code, name in zip(rel_momentum.code, rel_momentum.name):
-            cursor.execute(
-                f"SELECT close FROM daily_price WHERE code='{code}' and date='{start_date}'")
-            try:
-                fetch = cursor.fetchone()[0]
-                start_close = fetch
-            except:
-                continue
-
-            cursor.execute(
-                f"SELECT close FROM daily_price WHERE code='{code}' and date='{end_date}'")
-            try:
-                fetch = cursor.fetchone()[0]
-                end_close = fetch
-            except:
-                continue
-
-            temp_row = [code, name, start_close, end_close, (end_close / start_close - 1) * 100]
-            temp_df = pd.DataFrame([temp_row], columns=['code', 'name', 'start_close', 'end_close', 'return_'])
-            return_list.append(temp_df)
-        
-        return_df = pd.concat(return_list).reset_index(drop=True)
+        return_df = self.period_returns(start_date, end_date, rel_momentum.code)
+        return_df = return_df.set_index('code').reindex(rel_momentum.code).dropna().reset_index()
+        return_df['name'] = rel_momentum.set_index('code').name.reindex(return_df.code).values
         return {'returns': return_df, 'avg_return': return_df.return_.mean()}
-        connection.close()
\ No newline at end of file
+
+    # Rolling-rebalance backtest over [start_date, end_date].
+    # The universe close matrix is read once. At the last trading day of every {freq} period
+    # ('M', 'Q', 'W', ...), stocks are ranked by their return over the previous {lookback} periods:
+    # the top {number} (relative momentum) whose return beats {abs_threshold} % (absolute momentum)
+    # are held with equal weights until the next rebalance, otherwise that slot stays in cash.
+    # cost: transaction cost in % of traded value.
+    def backtest(self, start_date, end_date, lookback=12, number=20, freq='M', abs_threshold=0, cost=0):
+        load_start = (pd.Period(start_date, freq) - lookback - 1).start_time
+        close = self.pc.get_prices(start_date=load_start.strftime('%Y-%m-%d'), end_date=end_date, field='close')
+        close = close.astype(float)
+
+        # Rebalance at the last trading day of each period
+        dates = close.index.to_series()
+        rebalance = pd.DatetimeIndex(dates.groupby(dates.index.to_period(freq)).max())
+        prices = close.loc[rebalance]
+        held_prices = close.ffill().loc[rebalance]  # delisted / halted stocks keep their last price
+
+        # Lookback return requires prices on both rebalance days
+        lookback_return = (prices / prices.shift(lookback) - 1) * 100
+        rank = lookback_return.rank(axis=1, ascending=False, method='first')
+        selected = (rank <= number) & (lookback_return > abs_threshold)
+        weights = selected.astype(float) / number
+
+        # The last rebalance has no following period
+        in_range = (rebalance >= pd.Timestamp(start_date)) & (rebalance <= pd.Timestamp(end_date))
+        in_range[-1:] = False
+        if not in_range.any():
+            raise ValueError(f'No {freq} rebalance with a following period in [{start_date}, {end_date}]')
+        selected, weights = selected[in_range], weights[in_range]
+
+        # Return from each rebalance day to the next
+        forward_return = (held_prices.shift(-1) / held_prices - 1).fillna(0)[in_range]
+        # Turnover: value bought plus sold at each rebalance, as a fraction of equity; the first one buys in
+        turnover = weights.diff().abs().sum(axis=1)
+        turnover.iloc[0] = weights.iloc[0].abs().sum()
+        period_return = (weights * forward_return).sum(axis=1) - turnover * cost / 100
+
+        result = pd.DataFrame({'period_return': period_return, 'turnover': turnover,
+                               'holdings': selected.sum(axis=1)})
+        result['equity'] = (1 + result.period_return).cumprod()
+
+        holdings = selected.stack()
+        holdings = holdings[holdings].reset_index()[['date', 'code']]
+        holdings['name'] = holdings.code.map(self.code_name_match)
+        holdings['lookback_return'] = lookback_return.stack().reindex(
+            pd.MultiIndex.from_frame(holdings[['date', 'code']])).values
+        holdings['weight'] = 1 / number
+
+        return {'equity': result, 'holdings': holdings}